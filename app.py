@@ -1,6 +1,40 @@
 from fasthtml.common import *
-from routes import home_page, preview_handler, analyze_handler, dashboard_page
-from database import clear_all_detections
+from routes import (
+    home_page, preview_handler, analyze_handler, dashboard_page, dashboard_cards_handler, dashboard_events_handler,
+    analytics_page, defect_rates_handler, maintenance_stats_handler, ingest_stats_handler,
+    thumbnail_handler, image_handler, upload_handler, batch_upload_handler, batch_events_handler, health_handler,
+    ready_handler, batching_stats_handler, worker_stats_handler, cache_stats_handler, pipeline_stats_handler,
+    writer_stats_handler, dashboard_stats_handler, metrics_handler
+)
+from batch_jobs import resume_batch_jobs
+from database import init_db, clear_all_detections, detection_writer
+from executor import worker_pool
+from maintenance import maintenance
+from ingest import directory_ingest
+from model import load_in_background
+from uploads import UploadSizeLimit
+from config import (
+    MODEL_PRELOAD, MAINTENANCE_ENABLED, ANALYTICS_DAYS, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES,
+    UPLOAD_FORM_OVERHEAD_BYTES
+)
+
+# Create the detection store (and migrate a legacy detections.json) before serving
+init_db()
+
+# Load the model, run store maintenance and watch INGEST_DIR off the startup path so pages are served immediately
+startup = [load_in_background] if MODEL_PRELOAD else []
+# Batch jobs a restart interrupted pick up where they stopped
+startup.append(resume_batch_jobs)
+if MAINTENANCE_ENABLED:
+    startup.append(maintenance.start)
+if directory_ingest is not None:
+    startup.append(directory_ingest.start)
+
+# Stop taking new work, finish what is in flight, then write out any queued detection records
+shutdown = [maintenance.stop]
+if directory_ingest is not None:
+    shutdown.append(directory_ingest.stop)
+shutdown += [worker_pool.shutdown, detection_writer.close]
 
 # Initialize the FastHTML app
 app, rt = fast_app(
@@ -9,7 +43,14 @@ app, rt = fast_app(
         Link(rel="stylesheet", href="/static/style.css"),
         Script(src="https://unpkg.com/lucide@latest"),
         Script("lucide.createIcons();", type="module"),
-    )
+    ),
+    on_startup=startup,
+    on_shutdown=shutdown,
+    # Refuse oversized uploads before Starlette spools them to disk
+    middleware=(Middleware(UploadSizeLimit, limits={
+        "/preview": MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES,
+        "/batch": MAX_BATCH_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+    }),)
 )
 
 # Define routes
@@ -29,6 +70,86 @@ async def post(filename: str):
 def get():
     return dashboard_page()
 
+@rt("/analytics")
+def get(days: int = ANALYTICS_DAYS):
+    return analytics_page(days)
+
+@rt("/dashboard/events")
+def get(request, after: str = None):
+    return dashboard_events_handler(request, after)
+
+@rt("/dashboard/cards")
+def get(cursor: str):
+    return dashboard_cards_handler(cursor)
+
+@rt("/thumb/{detection_id}")
+def get(request, detection_id: int):
+    return thumbnail_handler(request, detection_id)
+
+@rt("/upload")
+def get(request, filename: str):
+    return upload_handler(request, filename)
+
+@rt("/image/{detection_id}")
+def get(request, detection_id: int):
+    return image_handler(request, detection_id)
+
+@rt("/batch")
+async def post(images: list[UploadFile]):
+    return await batch_upload_handler(images)
+
+@rt("/batch/{job_id}/events")
+def get(job_id: str):
+    return batch_events_handler(job_id)
+
+@rt("/health")
+def get():
+    return health_handler()
+
+@rt("/ready")
+def get():
+    return ready_handler()
+
+@rt("/stats/batching")
+def get():
+    return batching_stats_handler()
+
+@rt("/stats/workers")
+def get():
+    return worker_stats_handler()
+
+@rt("/stats/cache")
+def get():
+    return cache_stats_handler()
+
+@rt("/stats/pipeline")
+def get():
+    return pipeline_stats_handler()
+
+@rt("/stats/dashboard")
+def get():
+    return dashboard_stats_handler()
+
+@rt("/stats/writer")
+def get():
+    return writer_stats_handler()
+
+@rt("/stats/defect-rates")
+def get(days: int = ANALYTICS_DAYS, period: str = "day"):
+    return defect_rates_handler(days, period)
+
+@rt("/stats/ingest")
+def get():
+    return ingest_stats_handler()
+
+@rt("/stats/maintenance")
+def get():
+    return maintenance_stats_handler()
+
+@rt("/metrics")
+def get():
+    return metrics_handler()
+
 @rt("/clear-history")
 def post():
     clear_all_detections()
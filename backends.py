@@ -0,0 +1,220 @@
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from config import (
+    MODEL_PATH, MAX_DETECTIONS, INFERENCE_BACKEND, INFERENCE_THREADS,
+    ONNX_MODEL_PATH, ONNX_QUANTIZE, ONNX_IMGSZ
+)
+from preprocess import PreparedImage, letterbox
+
+def nms(boxes, scores, class_ids, iou_threshold: float, by_smaller: bool = False):
+    """
+    Class-aware greedy non-maximum suppression.
+
+    Returns indices of the boxes to keep, highest score first. Boxes of
+    different classes never suppress each other. With by_smaller, overlap is
+    measured as intersection over the smaller box's area instead of IoU, so
+    a box cut short by a tile edge still matches the full one it is part of.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Shift each class into its own coordinate range so one pass handles all classes
+    offsets = class_ids.astype(np.float32)[:, None] * (boxes.max() + 1)
+    shifted = boxes + offsets
+    x1, y1, x2, y2 = shifted.T
+    areas = (x2 - x1) * (y2 - y1)
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        if by_smaller:
+            iou = inter / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        else:
+            iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+def load_bgr(image) -> np.ndarray:
+    """Decode an image path to a BGR uint8 array; arrays and prepared images are not decoded again"""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, PreparedImage):
+        return image.pixels
+    from PIL import Image, ImageOps
+
+    with Image.open(image) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        return np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+
+class InferenceBackend:
+    """
+    A way of running the detection model.
+
+    predict() takes image paths, BGR uint8 arrays or PreparedImages and returns, per image, an
+    (N, 6) float32 array of x1, y1, x2, y2, confidence, class_id in that
+    image's pixel coordinates, already filtered by conf and NMS.
+    """
+
+    name = None
+
+    def predict(self, images, conf: float, iou: float, imgsz: int = None) -> List[np.ndarray]:
+        raise NotImplementedError
+
+class UltralyticsBackend(InferenceBackend):
+    """The PyTorch model run through ultralytics"""
+
+    name = "ultralytics"
+
+    def __init__(self, weights=MODEL_PATH, threads: int = INFERENCE_THREADS):
+        # Imported here so torch/ultralytics only load when this backend is chosen
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(str(weights))
+
+    def predict(self, images, conf: float, iou: float, imgsz: int = None) -> List[np.ndarray]:
+        # ultralytics letterboxes arrays itself; only paths are read from disk
+        sources = [str(image) if isinstance(image, (str, Path)) else load_bgr(image) for image in images]
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        outputs = self.model(sources, conf=conf, iou=iou, max_det=MAX_DETECTIONS, verbose=False, **kwargs)
+        return [output.boxes.data.cpu().numpy().astype(np.float32) for output in outputs]
+
+class OnnxBackend(InferenceBackend):
+    """
+    An exported YOLOv8-style .onnx model on ONNX Runtime's CPU provider.
+
+    Letterboxing, box decoding and NMS are done here in NumPy, so neither
+    torch nor ultralytics is needed at runtime.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, threads: int = INFERENCE_THREADS, quantize: bool = ONNX_QUANTIZE):
+        import onnxruntime as ort
+
+        model_path = Path(model_path)
+        if quantize:
+            model_path = quantize_onnx(model_path)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        # Symbolic dims mean the model was exported with dynamic=True
+        self.dynamic_batch = not isinstance(batch, int)
+        self.fixed_size = (height, width) if isinstance(height, int) and isinstance(width, int) else None
+
+    def _input_size(self, imgsz):
+        if self.fixed_size:
+            return self.fixed_size
+        size = imgsz or ONNX_IMGSZ
+        return size, size
+
+    def _decode(self, output: np.ndarray, conf: float, iou: float, scale: float, pad, shape) -> np.ndarray:
+        """Turn one image's (4 + classes, anchors) output into boxes in original pixels"""
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        mask = confidences >= conf
+        predictions, class_ids, confidences = predictions[mask], class_ids[mask], confidences[mask]
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+        boxes /= scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+
+        keep = nms(boxes, confidences, class_ids, iou)[:MAX_DETECTIONS]
+        data = np.empty((len(keep), 6), dtype=np.float32)
+        data[:, :4] = boxes[keep]
+        data[:, 4] = confidences[keep]
+        data[:, 5] = class_ids[keep]
+        return data
+
+    def predict(self, images, conf: float, iou: float, imgsz: int = None) -> List[np.ndarray]:
+        size = self._input_size(imgsz)
+        pixels = [load_bgr(image) for image in images]
+        # Prepared images keep their letterboxed input, so it is only built once per size
+        prepared = [
+            image.model_input(size) if isinstance(image, PreparedImage) else letterbox(array, size)
+            for image, array in zip(images, pixels)
+        ]
+
+        # HWC BGR uint8 -> NCHW RGB float32 in [0, 1]
+        batch = np.stack([canvas for canvas, _, _ in prepared])[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            outputs = np.concatenate([
+                self.session.run(None, {self.input_name: batch[i:i + 1]})[0] for i in range(len(batch))
+            ])
+
+        return [
+            self._decode(output, conf, iou, scale, pad, image.shape)
+            for output, (_, scale, pad), image in zip(outputs, prepared, pixels)
+        ]
+
+BACKENDS = {
+    UltralyticsBackend.name: UltralyticsBackend,
+    OnnxBackend.name: OnnxBackend
+}
+
+def create_backend(name: str = INFERENCE_BACKEND) -> InferenceBackend:
+    """Build the configured inference backend"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+def active_weights_path() -> Path:
+    """The weights file the configured backend loads"""
+    return Path(ONNX_MODEL_PATH if INFERENCE_BACKEND == OnnxBackend.name else MODEL_PATH)
+
+def export_onnx(weights=MODEL_PATH, imgsz: int = ONNX_IMGSZ) -> Path:
+    """Export the PyTorch weights to ONNX with a dynamic batch dimension"""
+    from ultralytics import YOLO
+    exported = YOLO(str(weights)).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    return Path(exported)
+
+def quantize_onnx(model_path) -> Path:
+    """Dynamic INT8 quantization of an ONNX model, cached next to it as <name>.int8.onnx"""
+    model_path = Path(model_path)
+    quantized_path = model_path.with_suffix(".int8.onnx")
+    if quantized_path.exists() and quantized_path.stat().st_mtime >= model_path.stat().st_mtime:
+        return quantized_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    tmp_path = quantized_path.with_suffix(".tmp")
+    quantize_dynamic(str(model_path), str(tmp_path), weight_type=QuantType.QUInt8)
+    os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+if __name__ == "__main__":
+    # python backends.py export | quantize
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "export":
+        print(f"Exported {export_onnx()}")
+    elif command == "quantize":
+        print(f"Quantized model written to {quantize_onnx(ONNX_MODEL_PATH)}")
+    else:
+        print("usage: python backends.py export | quantize")
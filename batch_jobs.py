@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from backends import load_bgr
+from config import BATCH_JOB_SIZE, BATCH_JOB_DECODE_THREADS, BATCH_JOB_PREFETCH
+from database import (
+    init_db, save_detections, get_completed_batch_files, detection_writer, save_batch_job, finish_batch_job,
+    get_batch_job, get_unfinished_batch_jobs
+)
+from model import get_detector
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+class BatchJob:
+    """Progress of one batch run over a list of files under a root directory"""
+
+    def __init__(self, job_id: str, root: Path, files: List[str]):
+        self.id = job_id
+        self.root = Path(root)
+        self.files = files
+        self.processed = 0
+        self.skipped = 0
+        self.defects = 0
+        self.failed = 0
+        self.started = None
+        self.finished = False
+        self.error = None
+        self._lock = threading.Lock()
+
+    def progress(self) -> Dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self.started if self.started else 0.0
+            return {
+                "job_id": self.id,
+                "total": len(self.files),
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "defects": self.defects,
+                "failed": self.failed,
+                "images_per_second": self.processed / elapsed if elapsed else 0.0,
+                "finished": self.finished,
+                "error": self.error
+            }
+
+# Jobs started through the web app, by id
+jobs: Dict[str, BatchJob] = {}
+
+def folder_job(folder: Path, job_id: str = None) -> BatchJob:
+    """Job over every image under a folder; the default id is stable so a rerun resumes"""
+    folder = Path(folder).resolve()
+    files = sorted(
+        str(p.relative_to(folder)) for p in folder.rglob("*")
+        if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES
+    )
+    job_id = job_id or hashlib.sha1(str(folder).encode()).hexdigest()[:16]
+    return BatchJob(job_id, folder, files)
+
+def prefetch(fn, items, threads: int, depth: int):
+    """Apply fn to items on a thread pool, yielding (item, result, error) in order, at most depth ahead"""
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="decode") as pool:
+        pending = deque((item, pool.submit(fn, item)) for item in itertools.islice(items, depth))
+        while pending:
+            item, future = pending.popleft()
+            for next_item in itertools.islice(items, 1):
+                pending.append((next_item, pool.submit(fn, next_item)))
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+def chunked(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def run_batch(job: BatchJob, batch_size: int = BATCH_JOB_SIZE, decode_threads: int = BATCH_JOB_DECODE_THREADS,
+              prefetch_depth: int = BATCH_JOB_PREFETCH):
+    """
+    Run a batch job to completion.
+
+    Files are decoded ahead of the model on decode_threads, run through the
+    model batch_size at a time (large ones tiled, as with any other scan, when
+    TILED_INFERENCE is on), and each batch is written to the store in a
+    single transaction. Files already recorded for this job id are skipped.
+    """
+    job.started = time.perf_counter()
+    try:
+        completed = get_completed_batch_files(job.id)
+        pending = [f for f in job.files if f not in completed]
+        job.skipped = len(job.files) - len(pending)
+
+        detector = get_detector()
+        decoded = prefetch(lambda name: load_bgr(job.root / name), pending, decode_threads, prefetch_depth)
+        for chunk in chunked(decoded, batch_size):
+            ok = [(name, pixels) for name, pixels, error in chunk if error is None]
+            results = detector.detect_batch([pixels for _, pixels in ok]) if ok else []
+
+            records = []
+            for (name, _), result in zip(ok, results):
+                has_defect, confidence, defect_type = result.summary()
+                records.append({
+                    "filename": name,
+                    "has_defect": has_defect,
+                    "confidence": confidence,
+                    "defect_type": defect_type,
+                    "boxes": result.pack()
+                })
+            save_detections(records, batch_job=job.id)
+
+            with job._lock:
+                job.processed += len(records)
+                job.defects += sum(r["has_defect"] for r in records)
+                # Failed files are not marked done, so a rerun retries them
+                job.failed += len(chunk) - len(ok)
+        # Finished means stored
+        detection_writer.flush()
+    except Exception as e:
+        job.error = str(e)
+        raise
+    finally:
+        job.finished = True
+
+def start_batch(job: BatchJob) -> BatchJob:
+    """
+    Run a job on a background thread and register it for progress streaming.
+
+    The job is recorded in the store first, so one interrupted by a restart
+    is resumed by resume_batch_jobs(). Starting a job that is already
+    running returns the running one.
+    """
+    running = jobs.get(job.id)
+    if running is not None and not running.finished:
+        return running
+    jobs[job.id] = job
+    save_batch_job(job.id, str(job.root), job.files)
+
+    def run():
+        try:
+            run_batch(job)
+            finish_batch_job(job.id)
+        except Exception:
+            # Reported through job.error; left unfinished, so the next start retries it
+            pass
+
+    threading.Thread(target=run, name=f"batch-{job.id}", daemon=True).start()
+    return job
+
+def upload_job_id(filenames: List[str]) -> str:
+    """Stable id for a job over uploaded files: stored names are content-addressed, so the same upload gets the same job"""
+    return hashlib.sha1("\n".join(sorted(filenames)).encode()).hexdigest()[:16]
+
+def find_job(job_id: str) -> Optional[BatchJob]:
+    """A job started in this process, or a recorded one from before a restart (resumed if it never finished)"""
+    job = jobs.get(job_id)
+    if job is not None:
+        return job
+    record = get_batch_job(job_id)
+    if record is None:
+        return None
+    job = BatchJob(record["job_id"], Path(record["root"]), record["files"])
+    if record["finished_at"] is None:
+        return start_batch(job)
+    job.skipped = len(get_completed_batch_files(job.id))
+    job.finished = True
+    return job
+
+def resume_batch_jobs():
+    """Restart jobs a previous run of the app left unfinished; the startup hook"""
+    for record in get_unfinished_batch_jobs():
+        if record["job_id"] not in jobs:
+            start_batch(BatchJob(record["job_id"], Path(record["root"]), record["files"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run defect detection over a folder of images")
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--job-id", help="resume or name a job (default: derived from the folder path)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_JOB_SIZE)
+    parser.add_argument("--threads", type=int, default=BATCH_JOB_DECODE_THREADS)
+    args = parser.parse_args()
+
+    init_db()
+    job = folder_job(args.folder, args.job_id)
+    runner = threading.Thread(target=run_batch, args=(job, args.batch_size, args.threads), daemon=True)
+    runner.start()
+    while runner.is_alive():
+        runner.join(2)
+        print(json.dumps(job.progress()), flush=True)
+    raise SystemExit(1 if job.error else 0)
+
+if __name__ == "__main__":
+    main()
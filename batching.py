@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from typing import Dict
+
+from config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, INFERENCE_QUEUE_SIZE
+from executor import QueueFullError, worker_pool
+from model import get_detector
+
+class BatchMetrics:
+    """Counters for tuning batch size and wait time against latency"""
+
+    def __init__(self, max_batch_size: int):
+        self.batches = 0
+        self.requests = 0
+        self.batch_size_counts = [0] * (max_batch_size + 1)
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_inference = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, batch_size: int, waits, inference_time: float):
+        with self._lock:
+            self.batches += 1
+            self.requests += batch_size
+            self.batch_size_counts[batch_size] += 1
+            self.total_wait += sum(waits)
+            self.max_wait = max(self.max_wait, *waits)
+            self.total_inference += inference_time
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "batch_size_histogram": {
+                    str(size): count for size, count in enumerate(self.batch_size_counts) if count
+                },
+                "avg_wait_ms": 1000 * self.total_wait / self.requests if self.requests else 0.0,
+                "max_wait_ms": 1000 * self.max_wait,
+                "avg_inference_ms": 1000 * self.total_inference / self.batches if self.batches else 0.0
+            }
+
+class BatchingDetector:
+    """
+    Collects concurrent detect() calls and runs them as one batched model call.
+
+    A batch is dispatched once it reaches max_batch_size or when max_wait_ms has
+    passed since its first request arrived, whichever comes first. Batches run on
+    the bounded worker pool, and detect() raises QueueFullError once max_queue
+    requests are already waiting.
+    """
+
+    def __init__(self, load_detector, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS,
+                 max_queue: int = INFERENCE_QUEUE_SIZE, executor=worker_pool):
+        self.load_detector = load_detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.executor = executor
+        self.metrics = BatchMetrics(max_batch_size)
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        """Start the collector task on the running event loop"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def detect(self, image_path):
+        """Queue an image and wait for its DetectionResult"""
+        self._ensure_worker()
+        if self._queue.qsize() >= self.max_queue:
+            raise QueueFullError(f"{self._queue.qsize()} inference requests already queued")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_path, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Wait for one request, then gather more until the batch is full or the window closes"""
+        batch = [await self._queue.get()]
+        # Requests that piled up during the previous batch go out without further waiting
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def queue_depth(self) -> int:
+        """Number of requests waiting for the next batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _detect_batch(self, paths):
+        """Runs on the worker pool; the first batch also pays for loading the model"""
+        return self.load_detector().detect_batch(paths)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            paths = [path for path, _, _ in batch]
+            started = time.perf_counter()
+            waits = [started - queued_at for _, _, queued_at in batch]
+
+            try:
+                results = await self.executor.run(self._detect_batch, paths)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.metrics.record(len(batch), waits, time.perf_counter() - started)
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+# Shared batching front-end for request handlers
+batcher = BatchingDetector(get_detector)
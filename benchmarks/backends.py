@@ -0,0 +1,106 @@
+"""
+Compare inference backends for speed and check that they agree.
+
+    python -m benchmarks.backends IMAGE_DIR [--backends ultralytics onnx onnx-int8] [--batch-size 1] [--repeat 3] [--min-parity 0.9]
+
+The first backend listed is the reference. For every other backend, each
+reference box must be matched by a box of the same class at IoU >= 0.5;
+parity is the fraction matched, plus the mean confidence difference of the
+matches. The run exits non-zero if any backend's parity is below --min-parity,
+so it can gate a switch of backend or an INT8 model. Results are printed as JSON.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from backends import OnnxBackend, UltralyticsBackend, load_bgr
+from benchmarks.tiling import IMAGE_SUFFIXES, box_iou
+from config import CONF_THRESHOLD, IOU_THRESHOLD
+
+BACKEND_FACTORIES = {
+    "ultralytics": lambda: UltralyticsBackend(),
+    "onnx": lambda: OnnxBackend(quantize=False),
+    "onnx-int8": lambda: OnnxBackend(quantize=True)
+}
+
+def run_backend(backend, images, batch_size: int, repeat: int):
+    """Per-image outputs from the last pass, and per-batch latencies over all passes"""
+    latencies = []
+    outputs = []
+    for _ in range(repeat):
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            started = time.perf_counter()
+            outputs.extend(backend.predict(batch, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD))
+            latencies.append((time.perf_counter() - started) / len(batch))
+    return outputs, np.array(latencies) * 1000
+
+def parity(reference, candidate, iou_threshold: float = 0.5):
+    """Fraction of reference boxes matched by the candidate, and mean |confidence difference|"""
+    matched, total, conf_diffs = 0, 0, []
+    for ref, cand in zip(reference, candidate):
+        total += len(ref)
+        if len(ref) == 0 or len(cand) == 0:
+            continue
+        iou = box_iou(ref[:, :4], cand[:, :4])
+        iou[ref[:, None, 5] != cand[None, :, 5]] = 0
+        best = iou.argmax(axis=1)
+        hit = iou[np.arange(len(ref)), best] >= iou_threshold
+        matched += int(hit.sum())
+        conf_diffs.extend(np.abs(ref[hit, 4] - cand[best[hit], 4]).tolist())
+    return {
+        "matched_fraction": matched / total if total else 1.0,
+        "reference_boxes": total,
+        "mean_confidence_diff": float(np.mean(conf_diffs)) if conf_diffs else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", type=Path)
+    parser.add_argument("--backends", nargs="+", default=["ultralytics", "onnx"], choices=sorted(BACKEND_FACTORIES))
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-parity", type=float, default=0.9)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.images.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    # Decode once up front so only inference is timed
+    images = [load_bgr(path) for path in paths]
+
+    report = {"images": len(images), "batch_size": args.batch_size, "backends": {}}
+    reference = None
+    failed = False
+    for name in args.backends:
+        started = time.perf_counter()
+        backend = BACKEND_FACTORIES[name]()
+        load_ms = (time.perf_counter() - started) * 1000
+
+        # One untimed pass to warm up
+        backend.predict(images[:args.batch_size], conf=CONF_THRESHOLD, iou=IOU_THRESHOLD)
+        outputs, latencies = run_backend(backend, images, args.batch_size, args.repeat)
+
+        entry = {
+            "load_ms": load_ms,
+            "latency_ms_per_image_mean": float(latencies.mean()),
+            "latency_ms_per_image_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_per_image_p95": float(np.percentile(latencies, 95))
+        }
+        if reference is None:
+            reference = outputs
+        else:
+            entry["parity"] = parity(reference, outputs)
+            failed |= entry["parity"]["matched_fraction"] < args.min_parity
+        report["backends"][name] = entry
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
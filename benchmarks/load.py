@@ -0,0 +1,232 @@
+"""
+Drive the real routes in process with concurrent clients against a stub model.
+
+    python -m benchmarks.load [--records 100k] [--clients 8] [--requests 200] [--scenarios preview analyze dashboard]
+                              [--batch-ms 20] [--image-ms 5] [--workdir DIR] [--output report.json]
+                              [--baseline baseline.json] [--tolerance 0.2]
+
+The app runs against a synthetic workdir (see benchmarks.synthetic) with
+StubBackend in place of the model, and requests go straight to the ASGI app,
+so no network, weights or GPU are involved. Each scenario reports throughput,
+latency percentiles, response sizes, status codes and the process's peak RSS
+so far, as JSON.
+
+Every /preview and /analyze request uses a distinct image, so the result cache
+never answers for the model. With --baseline, each scenario is compared to an
+earlier report and the run exits non-zero when throughput drops or p95
+latency rises by more than --tolerance.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from benchmarks.synthetic import SIZES, generate, panel_bytes, parse_size
+
+SCENARIOS = ["preview", "analyze", "dashboard"]
+
+async def asgi_request(app, method: str, url: str, body: bytes = b"", content_type: str = None):
+    """Call an ASGI app directly; returns (status, response body)"""
+    parts = urlsplit(url)
+    headers = [(b"host", b"benchmark")]
+    if content_type:
+        headers += [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": parts.path, "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(), "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 0), "server": ("benchmark", 80)
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+def multipart(field: str, filename: str, data: bytes, content_type: str = "image/jpeg"):
+    boundary = "benchmark-boundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+def unique_image(base: bytes, i: int) -> bytes:
+    """The same JPEG with bytes after its end marker, so each request hashes differently"""
+    return base + f"benchmark-{i}".encode()
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+async def run_scenario(make_request, requests: int, clients: int) -> Dict:
+    """Run requests calls of make_request(i) from clients concurrent tasks"""
+    latencies, sizes, statuses = [], [], {}
+    next_index = iter(range(requests))
+
+    async def client():
+        for i in next_index:
+            started = time.perf_counter()
+            status, body = await make_request(i)
+            latencies.append(time.perf_counter() - started)
+            sizes.append(len(body))
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "duration_s": elapsed,
+        "throughput_rps": requests / elapsed,
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "latency_ms_p99": float(np.percentile(latencies, 99)),
+        "latency_ms_max": float(latencies.max()),
+        "response_bytes_mean": float(np.mean(sizes)),
+        "response_bytes_max": int(max(sizes)),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+async def run_all(app, scenarios: List[str], requests: int, clients: int, seed: int) -> Dict:
+    from uploads import store_upload
+
+    base = panel_bytes(np.random.default_rng(seed + 1))
+    # One untimed request so first-call setup is not counted against a scenario
+    await asgi_request(app, "GET", "/dashboard")
+    results = {}
+    for scenario in scenarios:
+        if scenario == "preview":
+            async def make_request(i):
+                body, content_type = multipart("image", f"bench_{i}.jpg", unique_image(base, i))
+                return await asgi_request(app, "POST", "/preview", body, content_type)
+        elif scenario == "analyze":
+            # Stored up front and untimed, as /preview would have done
+            names = [store_upload(io.BytesIO(unique_image(base, requests + i)), f"bench_{i}.jpg") for i in range(requests)]
+
+            async def make_request(i):
+                body = urlencode({"filename": names[i]}).encode()
+                return await asgi_request(app, "POST", "/analyze", body, "application/x-www-form-urlencoded")
+        elif scenario == "dashboard":
+            async def make_request(i):
+                return await asgi_request(app, "GET", "/dashboard")
+        else:
+            raise ValueError(f"Unknown scenario {scenario!r}")
+
+        results[scenario] = await run_scenario(make_request, requests, clients)
+    return results
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> Dict:
+    """Per-scenario ratios against a baseline report, flagging regressions beyond tolerance"""
+    comparison = {}
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        throughput = current["throughput_rps"] / previous["throughput_rps"]
+        p95 = current["latency_ms_p95"] / previous["latency_ms_p95"]
+        comparison[name] = {
+            "throughput_ratio": throughput,
+            "p95_ratio": p95,
+            "peak_rss_ratio": current["peak_rss_mb"] / previous["peak_rss_mb"],
+            "regression": throughput < 1 - tolerance or p95 > 1 + tolerance
+        }
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=parse_size, default=SIZES["100k"], help="history size: a count or 1k, 100k, 1m")
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--batch-ms", type=float, default=20.0, help="stub model latency per batch")
+    parser.add_argument("--image-ms", type=float, default=5.0, help="stub model latency per image")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="reused between runs if the data parameters match")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    output = args.output.resolve() if args.output else None
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    workdir = (args.workdir or Path(tempfile.mkdtemp(prefix="defect-bench-"))).resolve()
+
+    # Build the data, then import the app from inside the workdir so its relative paths land there
+    started = time.perf_counter()
+    generate(workdir, args.records, args.uploads, seed=args.seed)
+    setup_seconds = time.perf_counter() - started
+
+    # A reused workdir would otherwise answer this run's /analyze requests from the last run's cache
+    from config import RESULT_CACHE_DB
+    RESULT_CACHE_DB.unlink(missing_ok=True)
+
+    from benchmarks.stub import install_stub
+    install_stub(batch_ms=args.batch_ms, image_ms=args.image_ms, seed=args.seed)
+    from app import app
+    from executor import worker_pool
+
+    try:
+        scenarios = asyncio.run(run_all(app, args.scenarios, args.requests, args.clients, args.seed))
+    finally:
+        worker_pool.shutdown()
+
+    report = {
+        "config": {
+            "records": args.records, "uploads": args.uploads, "clients": args.clients, "requests": args.requests,
+            "batch_ms": args.batch_ms, "image_ms": args.image_ms, "seed": args.seed
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "setup_seconds": setup_seconds,
+        "scenarios": scenarios
+    }
+    regressed = False
+    if baseline:
+        report["comparison"] = compare(report, baseline, args.tolerance)
+        regressed = any(entry["regression"] for entry in report["comparison"].values())
+
+    text = json.dumps(report, indent=2)
+    if output:
+        output.write_text(text)
+    print(text)
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
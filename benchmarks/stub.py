@@ -0,0 +1,60 @@
+"""
+Deterministic stand-in for the detection model, for benchmarks on machines
+without best.pt or a GPU.
+
+StubBackend sleeps for a configurable time per batch and per image, then
+returns boxes derived from a checksum of the pixels, so the same image always
+gets the same result. Everything above the backend (DefectDetector,
+batching, tiling, storage) is the real code.
+"""
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+import model
+from backends import InferenceBackend, load_bgr
+from model import DEFECT_NAMES, DefectDetector
+
+class StubBackend(InferenceBackend):
+    name = "stub"
+
+    def __init__(self, batch_ms: float = 20.0, image_ms: float = 5.0, defect_rate: float = 0.6, seed: int = 0):
+        self.batch_ms = batch_ms
+        self.image_ms = image_ms
+        self.defect_rate = defect_rate
+        self.seed = seed
+        self.calls = 0
+
+    def _boxes(self, pixels: np.ndarray, conf: float) -> np.ndarray:
+        height, width = pixels.shape[:2]
+        rng = np.random.default_rng([self.seed, zlib.crc32(pixels[::16, ::16].tobytes())])
+        if rng.random() >= self.defect_rate:
+            return np.empty((0, 6), dtype=np.float32)
+
+        count = int(rng.integers(1, 4))
+        data = np.empty((count, 6), dtype=np.float32)
+        x1 = rng.uniform(0, width * 0.9, count)
+        y1 = rng.uniform(0, height * 0.9, count)
+        data[:, 0], data[:, 1] = x1, y1
+        data[:, 2] = np.minimum(x1 + rng.uniform(8, width * 0.1 + 8, count), width)
+        data[:, 3] = np.minimum(y1 + rng.uniform(8, height * 0.1 + 8, count), height)
+        data[:, 4] = rng.uniform(max(conf, 0.3), 0.99, count)
+        data[:, 5] = rng.integers(0, len(DEFECT_NAMES), count)
+        return data[np.argsort(-data[:, 4])]
+
+    def predict(self, images, conf: float, iou: float, imgsz: int = None) -> List[np.ndarray]:
+        self.calls += 1
+        pixels = [load_bgr(image) for image in images]
+        # Sleeping releases the GIL, like a real runtime does during inference
+        time.sleep((self.batch_ms + self.image_ms * len(pixels)) / 1000)
+        return [self._boxes(image, conf) for image in pixels]
+
+def install_stub(**kwargs) -> DefectDetector:
+    """Make get_detector() return a DefectDetector running on a StubBackend"""
+    started = time.perf_counter()
+    detector = DefectDetector(backend=StubBackend(**kwargs))
+    model._detector = detector
+    model.load_seconds = time.perf_counter() - started
+    return detector
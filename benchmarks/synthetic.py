@@ -0,0 +1,124 @@
+"""
+Generate a synthetic detection history and upload directory.
+
+    python -m benchmarks.synthetic WORKDIR [--records 100k] [--uploads 200] [--hours 24] [--seed 0]
+
+WORKDIR becomes the app's working directory: uploads/ gets --uploads
+synthetic panel images and detections.db gets --records detections spread
+over the last --hours, each pointing at one of those images. --records takes
+a count or one of the sizes 1k, 100k and 1m. The same seed always produces
+the same images and history.
+"""
+import argparse
+import io
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+INSERT_CHUNK = 10_000
+
+def parse_size(value: str) -> int:
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+def make_panel(rng: np.random.Generator, width: int = 640, height: int = 480) -> Image.Image:
+    """A board-like image: green substrate with random copper traces and pads"""
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[:] = (20, 90 + int(rng.integers(0, 30)), 40)
+    for _ in range(int(rng.integers(20, 40))):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        if rng.random() < 0.5:
+            pixels[y:y + 4, x:x + int(rng.integers(20, 200))] = (200, 140, 60)
+        else:
+            pixels[y:y + int(rng.integers(20, 200)), x:x + 4] = (200, 140, 60)
+    noise = rng.integers(0, 12, size=pixels.shape, dtype=np.uint8)
+    return Image.fromarray(pixels + noise)
+
+def panel_bytes(rng: np.random.Generator, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    make_panel(rng, **kwargs).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+def generate_uploads(count: int, seed: int = 0) -> List[str]:
+    """Store count synthetic images through the normal upload path; returns the stored names"""
+    from uploads import store_upload
+
+    rng = np.random.default_rng(seed)
+    return [store_upload(io.BytesIO(panel_bytes(rng)), f"panel_{i:05d}.jpg") for i in range(count)]
+
+def generate_history(records: int, filenames: List[str], hours: float = 24, seed: int = 0) -> int:
+    """Insert records detections, oldest first, evenly spread over the last hours"""
+    from database import detection_writer, save_detections
+    from model import DEFECT_NAMES, DetectionResult
+
+    rng = random.Random(seed)
+    defect_types = list(DEFECT_NAMES.values())
+    start = datetime.now() - timedelta(hours=hours)
+    step = timedelta(hours=hours) / max(records, 1)
+
+    for chunk_start in range(0, records, INSERT_CHUNK):
+        chunk = []
+        for i in range(chunk_start, min(chunk_start + INSERT_CHUNK, records)):
+            has_defect = rng.random() < 0.4
+            confidence = rng.uniform(0.3, 0.99) if has_defect else 0.0
+            class_id = rng.randrange(len(defect_types))
+            boxes = DetectionResult([[10, 10, 60, 60]], [confidence], [class_id]) if has_defect else DetectionResult([], [], [])
+            chunk.append({
+                "timestamp": (start + step * i).isoformat(),
+                "filename": filenames[i % len(filenames)] if filenames else f"missing_{i}.jpg",
+                "has_defect": has_defect,
+                "confidence": confidence,
+                "defect_type": defect_types[class_id] if has_defect else None,
+                "boxes": boxes.pack()
+            })
+        save_detections(chunk)
+    detection_writer.flush()
+    return records
+
+def generate(workdir: Path, records: int, uploads: int, hours: float = 24, seed: int = 0) -> dict:
+    """
+    Build a synthetic workdir and make it the current directory.
+
+    A manifest records the parameters, so calling this again with the same
+    ones reuses the existing data instead of regenerating it.
+    """
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+
+    params = {"records": records, "uploads": uploads, "hours": hours, "seed": seed}
+    manifest = Path("synthetic.json")
+    if manifest.exists() and json.loads(manifest.read_text()).get("params") == params:
+        return json.loads(manifest.read_text())
+
+    from database import DB_FILE, init_db
+    for path in [DB_FILE, *DB_FILE.parent.glob(DB_FILE.name + "-*")]:
+        path.unlink(missing_ok=True)
+    init_db()
+
+    filenames = generate_uploads(uploads, seed)
+    generate_history(records, filenames, hours, seed)
+    info = {"params": params, "filenames": filenames}
+    manifest.write_text(json.dumps(info))
+    return info
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("workdir", type=Path)
+    parser.add_argument("--records", type=parse_size, default=SIZES["100k"])
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    info = generate(args.workdir.resolve(), args.records, args.uploads, args.hours, args.seed)
+    print(json.dumps(info["params"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare whole-image and tiled inference on a folder of panel images.
+
+    python -m benchmarks.tiling IMAGE_DIR [--labels LABEL_DIR] [--tile-size 640] [--overlap 0.2] [--batch-size 8]
+
+LABEL_DIR holds YOLO-format ground truth (one "class cx cy w h" line per
+defect, normalized) named after each image. With labels, recall at IoU 0.5 is
+reported per mode; latency is always reported. Results are printed as JSON.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from model import get_detector
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+
+def load_labels(label_path: Path, width: int, height: int):
+    """Ground truth boxes as (N, 4) xyxy pixels and (N,) class ids"""
+    if not label_path.exists():
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.int64)
+    rows = np.loadtxt(label_path, ndmin=2, dtype=np.float32)
+    if rows.size == 0:
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.int64)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, rows[:, 0].astype(np.int64)
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def matched(result, gt_boxes, gt_classes, iou_threshold: float = 0.5) -> int:
+    """Number of ground truth boxes hit by a prediction of the same class"""
+    if len(gt_boxes) == 0 or len(result) == 0:
+        return 0
+    iou = box_iou(gt_boxes, result.boxes)
+    same_class = gt_classes[:, None] == result.class_ids[None, :]
+    return int(((iou >= iou_threshold) & same_class).any(axis=1).sum())
+
+def summarize(latencies, hits: int, total: int):
+    latencies = np.array(latencies) * 1000
+    return {
+        "images": len(latencies),
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "recall": hits / total if total else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", type=Path)
+    parser.add_argument("--labels", type=Path)
+    parser.add_argument("--tile-size", type=int, default=None)
+    parser.add_argument("--overlap", type=float, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    tile_kwargs = {
+        name: value for name, value in
+        (("tile_size", args.tile_size), ("overlap", args.overlap), ("batch_size", args.batch_size))
+        if value is not None
+    }
+
+    detector = get_detector()
+    paths = sorted(p for p in args.images.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    modes = {
+        "whole": lambda path: detector.detect_whole([path])[0],
+        "tiled": lambda path: detector.detect_tiled(path, **tile_kwargs)
+    }
+
+    report = {"tile_settings": tile_kwargs}
+    for mode, run in modes.items():
+        latencies, hits, total = [], 0, 0
+        for path in paths:
+            started = time.perf_counter()
+            result = run(path)
+            latencies.append(time.perf_counter() - started)
+
+            if args.labels:
+                with Image.open(path) as img:
+                    gt_boxes, gt_classes = load_labels(args.labels / f"{path.stem}.txt", img.width, img.height)
+                hits += matched(result, gt_boxes, gt_classes)
+                total += len(gt_boxes)
+        report[mode] = summarize(latencies, hits, total) if paths else {"images": 0}
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
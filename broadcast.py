@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import LIVE_BACKLOG, LIVE_KEEPALIVE_SECONDS, LIVE_MAX_SUBSCRIBERS
+
+# Tells a client it missed more than can be replayed, so it should reload the page
+RELOAD_EVENT = "event: reload\ndata: {}\n\n"
+
+class TooManySubscribersError(Exception):
+    """Raised when LIVE_MAX_SUBSCRIBERS streams are already open"""
+
+class Broadcaster:
+    """
+    Fan-out of newly saved detection records to live dashboard streams.
+
+    Records go into a ring of the last `backlog` events. publish() may be
+    called from any thread and costs one wake-up of the event loop however
+    many subscribers there are; each event is rendered once, on first read,
+    and the text is shared by every subscriber. A subscriber that falls off
+    the end of the ring is told to reload.
+    """
+
+    def __init__(self, backlog: int = LIVE_BACKLOG, max_subscribers: int = LIVE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self.published = 0
+        self._events = deque(maxlen=backlog)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._changed = None
+
+    def publish(self, records: List[Dict]):
+        """Queue saved records (with ids) for every open stream"""
+        with self._lock:
+            for record in records:
+                self.published += 1
+                self._events.append({"seq": self.published, "record": record, "text": None})
+            loop = self._loop
+        if loop is not None and self.subscribers:
+            try:
+                loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # The loop has closed; nobody is listening any more
+                pass
+
+    def _wake(self):
+        # Waiters hold the old event; new waiters get a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _since(self, seq: int):
+        """Events after seq, and whether some were already dropped from the ring"""
+        with self._lock:
+            if not self._events or self._events[-1]["seq"] <= seq:
+                return [], False
+            missed = self._events[0]["seq"] > seq + 1
+            return [event for event in self._events if event["seq"] > seq], missed
+
+    def stream(self, render: Callable[[Dict], str], catch_up: Callable[[int], Awaitable[Optional[List]]], last_id: int = None):
+        """
+        SSE text for every record published from now on, as an async generator.
+
+        With last_id, awaiting catch_up(last_id) first supplies what the client missed
+        from the store, as (id, text) pairs, or None when that is too much to
+        replay. A client that cannot be caught up is sent a reload event.
+        Keep-alive comments go out every LIVE_KEEPALIVE_SECONDS while idle.
+
+        Raises TooManySubscribersError up front, before any response is sent.
+        """
+        with self._lock:
+            if self.subscribers >= self.max_subscribers:
+                raise TooManySubscribersError(f"{self.subscribers} live streams already open")
+            self.subscribers += 1
+        return self._stream(render, catch_up, last_id)
+
+    async def _stream(self, render, catch_up, last_id):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                self._loop = loop
+                self._changed = asyncio.Event()
+            seq = self.published
+
+        try:
+            if last_id is not None:
+                missed = await catch_up(last_id)
+                if missed is None:
+                    yield RELOAD_EVENT
+                    return
+                for record_id, text in missed:
+                    yield text
+                    last_id = record_id
+
+            while True:
+                changed = self._changed
+                events, dropped = self._since(seq)
+                if dropped:
+                    yield RELOAD_EVENT
+                    return
+                for event in events:
+                    seq = event["seq"]
+                    record_id = event["record"]["id"]
+                    # Records are published in id order, so anything at or below last_id was sent by catch_up
+                    if last_id is not None and record_id <= last_id:
+                        continue
+                    if event["text"] is None:
+                        event["text"] = render(event["record"])
+                    yield event["text"]
+                    last_id = record_id
+                if events:
+                    continue
+
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"subscribers": self.subscribers, "published": self.published, "backlog": len(self._events)}
+
+# Fed by database.detection_writer after each commit, read by the dashboard's event stream
+live_updates = Broadcaster()
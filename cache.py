@@ -0,0 +1,133 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from backends import active_weights_path
+from config import (
+    CONF_THRESHOLD, IOU_THRESHOLD, CLASS_CONF_THRESHOLDS, MAX_DETECTIONS,
+    INFERENCE_BACKEND, ONNX_QUANTIZE, TILED_INFERENCE, TILE_MIN_PIXELS, TILE_SIZE, TILE_OVERLAP, TILE_MERGE_THRESHOLD,
+    RESULT_CACHE_DB, RESULT_CACHE_SIZE
+)
+from model import DetectionResult
+
+CHUNK_SIZE = 1 << 20
+
+def hash_file(path) -> str:
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Detection results keyed by image content and model identity.
+
+    The in-memory LRU answers repeat uploads without touching disk; the SQLite
+    tier survives restarts. The model identity (weights hash plus thresholds
+    and tiling settings) is part of every key, and is recomputed whenever the
+    weights file changes, so results from old weights are never returned.
+    """
+
+    def __init__(self, db_file: Path = RESULT_CACHE_DB, max_entries: int = RESULT_CACHE_SIZE, model_path=None):
+        self.max_entries = max_entries
+        self.model_path = Path(model_path or active_weights_path())
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._weights_stat = None
+        self._identity = None
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._conn:
+            # Earlier versions cached only the summary tuple
+            self._conn.execute("DROP TABLE IF EXISTS results")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_boxes (key TEXT PRIMARY KEY, model TEXT NOT NULL, boxes BLOB NOT NULL)"
+            )
+
+    def _model_identity(self) -> str:
+        """Hash of the weights and thresholds, refreshed when the weights file changes"""
+        try:
+            stat = self.model_path.stat()
+            weights_stat = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            weights_stat = None
+
+        if weights_stat != self._weights_stat or self._identity is None:
+            weights_hash = hash_file(self.model_path) if weights_stat else "missing"
+            thresholds = sorted(CLASS_CONF_THRESHOLDS.items())
+            identity = hashlib.sha256(
+                f"{weights_hash}:backend={INFERENCE_BACKEND}:int8={ONNX_QUANTIZE}:conf={CONF_THRESHOLD}"
+                f":iou={IOU_THRESHOLD}:classes={thresholds}:max_det={MAX_DETECTIONS}"
+                f":tiled={TILED_INFERENCE}:tile_min={TILE_MIN_PIXELS}:tile={TILE_SIZE}:overlap={TILE_OVERLAP}"
+                f":tile_merge={TILE_MERGE_THRESHOLD}".encode()
+            ).hexdigest()
+            if identity != self._identity:
+                # New weights: drop everything computed by the old model
+                self._memory.clear()
+                with self._conn:
+                    self._conn.execute("DELETE FROM result_boxes WHERE model != ?", (identity,))
+            self._weights_stat = weights_stat
+            self._identity = identity
+        return self._identity
+
+    def get(self, image_hash: str) -> Optional[DetectionResult]:
+        """Look up the cached DetectionResult for an image hash"""
+        with self._lock:
+            identity = self._model_identity()
+            key = f"{identity}:{image_hash}"
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            row = self._conn.execute("SELECT boxes FROM result_boxes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            result = DetectionResult.unpack(row[0])
+            self._remember(key, result)
+            self.hits += 1
+            return result
+
+    def put(self, image_hash: str, result: DetectionResult):
+        """Store a detection result in both tiers"""
+        with self._lock:
+            identity = self._model_identity()
+            key = f"{identity}:{image_hash}"
+            self._remember(key, result)
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO result_boxes (key, model, boxes) VALUES (?, ?, ?)",
+                    (key, identity, result.pack())
+                )
+
+    def _remember(self, key: str, result: DetectionResult):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def lookup_file(self, path) -> Tuple[str, Optional[DetectionResult]]:
+        """Hash an image file and return (image_hash, cached result or None)"""
+        image_hash = hash_file(path)
+        return image_hash, self.get(image_hash)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries_in_memory": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# Shared result cache
+result_cache = ResultCache()
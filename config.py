@@ -2,10 +2,157 @@ from pathlib import Path
 
 # Model configuration
 MODEL_PATH = "best.pt"
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+# Inference backend: "ultralytics" (PyTorch weights at MODEL_PATH) or "onnx"
+# (ONNX Runtime on CPU with the exported model at ONNX_MODEL_PATH, optionally
+# dynamically quantized to INT8). INFERENCE_THREADS = 0 keeps the runtime default.
+INFERENCE_BACKEND = "ultralytics"
+INFERENCE_THREADS = 0
+ONNX_MODEL_PATH = "best.onnx"
+ONNX_QUANTIZE = False
+ONNX_IMGSZ = 640
 
-# Upload directory
+# Out-of-process inference server (python inference_server.py). When an address
+# is set, web workers send decoded images through shared memory to
+# INFERENCE_SERVER_WORKERS model processes instead of loading the model
+# themselves; keep INFERENCE_SERVER_WORKERS * INFERENCE_THREADS <= CPU cores.
+# An image takes as many consecutive slots as it needs (a 20 MP BGR panel
+# takes 8 of 8 MiB); one larger than the whole segment is passed by path, or
+# pickled over the socket if it has no file. Clients give up on a request
+# after INFERENCE_SERVER_TIMEOUT_SECONDS waiting for slots or for its result.
+INFERENCE_SERVER_ADDRESS = None  # e.g. "/tmp/defect-inference.sock"
+INFERENCE_SERVER_AUTHKEY = b"defect-detection"
+INFERENCE_SERVER_WORKERS = 2
+INFERENCE_SERVER_TIMEOUT_SECONDS = 120
+INFERENCE_SHM_SLOTS = 32
+INFERENCE_SHM_SLOT_BYTES = 8 * 1024 * 1024
+
+# Per-defect-type overrides of CONF_THRESHOLD, e.g. {"spur": 0.4}
+CLASS_CONF_THRESHOLDS = {}
+# Keep at most this many boxes per image, most confident first
+MAX_DETECTIONS = 100
+
+# Tiled inference for high-resolution panel images: images of at least
+# TILE_MIN_PIXELS are cut into overlapping TILE_SIZE tiles instead of being
+# downscaled to the model input size. Boxes from neighbouring tiles are merged
+# when their intersection covers TILE_MERGE_THRESHOLD of the smaller box: a
+# defect cut by a tile edge overlaps its full detection far too little for
+# IOU_THRESHOLD to catch.
+TILED_INFERENCE = False
+TILE_MIN_PIXELS = 4_000_000
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_BATCH_SIZE = 8
+TILE_MERGE_THRESHOLD = 0.5
+
+# Load the model in the background at startup (otherwise on first /analyze),
+# and warm it up on a blank image before marking the server ready
+MODEL_PRELOAD = True
+MODEL_WARMUP = True
+MODEL_WARMUP_SIZE = 640
+
+# Result cache keyed by image hash and model identity
+RESULT_CACHE_DB = Path("result_cache.db")
+RESULT_CACHE_SIZE = 1024
+
+# Micro-batching of concurrent /analyze requests
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT_MS = 10
+
+# Worker pool for inference and storage I/O; requests beyond the queue get a 503
+WORKER_THREADS = 2
+WORKER_QUEUE_SIZE = 32
+INFERENCE_QUEUE_SIZE = 64
+RETRY_AFTER_SECONDS = 5
+
+# Batch jobs over folders or multi-file uploads
+BATCH_JOB_SIZE = 16
+BATCH_JOB_DECODE_THREADS = 4
+BATCH_JOB_PREFETCH = 32
+
+# Latency timers and counters served at /metrics; quantiles cover the last
+# METRICS_WINDOW observations of each stage
+METRICS_ENABLED = True
+METRICS_WINDOW = 2048
+
+# Live dashboard updates: recent events kept for streams that lag briefly,
+# idle keep-alive interval, open stream limit, and how many missed detections
+# a reconnecting client may replay before it is told to reload instead.
+# Open dashboards also re-read the stats every LIVE_STATS_REFRESH_SECONDS so
+# old scans drop out of the window while nothing new arrives, and keep at most
+# LIVE_MAX_CARDS cards (older ones load again on scroll).
+LIVE_BACKLOG = 256
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_MAX_SUBSCRIBERS = 1000
+LIVE_CATCHUP_LIMIT = 200
+LIVE_STATS_REFRESH_SECONDS = 60
+LIVE_MAX_CARDS = 200
+
+# Write-behind queue for detection records: one transaction per
+# WRITE_BATCH_SIZE records or WRITE_FLUSH_MS after the oldest was queued;
+# savers block only when WRITE_QUEUE_MAX records are waiting
+WRITE_BATCH_SIZE = 64
+WRITE_FLUSH_MS = 50
+WRITE_QUEUE_MAX = 10000
+
+# Background maintenance of the detection store: every
+# MAINTENANCE_INTERVAL_MINUTES, new detections are counted into hourly and
+# daily rollups per defect type, then raw detections and uploaded images older
+# than RETENTION_DAYS are deleted (None keeps them forever). Hourly rollups are
+# kept ROLLUP_HOURLY_RETENTION_DAYS, daily ones indefinitely. Work is done in
+# transactions of at most MAINTENANCE_BATCH_SIZE rows.
+MAINTENANCE_ENABLED = True
+MAINTENANCE_INTERVAL_MINUTES = 10
+MAINTENANCE_BATCH_SIZE = 5000
+RETENTION_DAYS = 90
+ROLLUP_HOURLY_RETENTION_DAYS = 90
+# Default range of the analytics page and /stats/defect-rates
+ANALYTICS_DAYS = 30
+
+# Directory-watch ingestion (python ingest.py FOLDER, or with the app when
+# INGEST_DIR is set). New images are noticed through watchdog if it is
+# installed, otherwise by rescanning every INGEST_POLL_SECONDS, and are taken
+# once unmodified for INGEST_SETTLE_MS. A frame whose difference hash is within
+# INGEST_HASH_THRESHOLD bits (of 64) of one of the last INGEST_DEDUPE_WINDOW
+# kept frames is skipped as a re-capture. Kept frames are copied into
+# UPLOAD_DIR and run through the model INGEST_BATCH_SIZE at a time; files
+# arriving while INGEST_QUEUE_MAX are waiting are dropped until a restart.
+# INGEST_MAX_BYTES caps the size of a captured file (None: no cap; the web
+# MAX_UPLOAD_BYTES limit does not apply). Files older than RETENTION_DAYS are
+# not ingested, and their done-marks are pruned by the maintenance job.
+INGEST_DIR = None  # e.g. Path("/mnt/aoi/captures")
+INGEST_POLL_SECONDS = 1.0
+INGEST_SETTLE_MS = 500
+INGEST_HASH_THRESHOLD = 6
+INGEST_DEDUPE_WINDOW = 64
+INGEST_BATCH_SIZE = 16
+INGEST_QUEUE_MAX = 10000
+INGEST_MAX_BYTES = None
+
+# Dashboard statistics window
+STATS_WINDOW_MINUTES = 60
+
+# Detection cards per dashboard page (later pages load on scroll)
+DASHBOARD_PAGE_SIZE = 20
+
+# Upload directory. Request bodies over the limit (one image for /preview, all
+# of them for /batch, plus UPLOAD_FORM_OVERHEAD_BYTES of multipart framing) are
+# refused with 413 before they are read.
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_BATCH_UPLOAD_BYTES = 500 * 1024 * 1024
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Thumbnail cache for dashboard cards
+THUMB_DIR = Path("thumbnails")
+THUMB_DIR.mkdir(exist_ok=True)
+THUMB_SIZE = (120, 120)
+THUMB_FORMAT = "WEBP"
+THUMB_QUALITY = 80
+THUMB_CACHE_MAX_FILES = 5000
 
 # Static files directory
 STATIC_DIR = Path("static")
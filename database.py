@@ -1,66 +1,676 @@
+import atexit
 import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
-DB_FILE = Path("detections.json")
+from broadcast import live_updates
+from config import (
+    DASHBOARD_PAGE_SIZE, LIVE_CATCHUP_LIMIT, WRITE_BATCH_SIZE, WRITE_FLUSH_MS, WRITE_QUEUE_MAX, MAINTENANCE_BATCH_SIZE,
+    ANALYTICS_DAYS
+)
+from metrics import count_scan, timed
+from stats import rolling_stats
+
+DB_FILE = Path("detections.db")
+
+# Rollup periods and the length of the timestamp prefix that names each bucket
+ROLLUP_PERIODS = {"hour": 13, "day": 10}
+
+# Legacy store: a single JSON array rewritten on every save
+LEGACY_DB_FILE = Path("detections.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    has_defect INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    defect_type TEXT,
+    boxes BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_filename ON detections (filename);
+CREATE TABLE IF NOT EXISTS batch_files (
+    job_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    marked_at TEXT,
+    PRIMARY KEY (job_id, filename)
+);
+-- Batch jobs started through the web app, so they can be found and resumed after a restart;
+-- files is a JSON list relative to root, finished_at stays NULL until the job has run to the end
+CREATE TABLE IF NOT EXISTS batch_jobs (
+    job_id TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    files TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+-- Detection counts per hour or day and defect type ('' for clean scans);
+-- bucket is the timestamp prefix, e.g. 2026-01-05T14 or 2026-01-05
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    defect_type TEXT NOT NULL,
+    scans INTEGER NOT NULL,
+    defects INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket, defect_type)
+);
+-- rolled_up_id: every detection up to this id is counted in rollups
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+def _connect() -> sqlite3.Connection:
+    """Open a connection for the current thread, creating the schema on first use"""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+
+    with _init_lock:
+        if not _initialized:
+            with conn:
+                conn.executescript(SCHEMA)
+                # Stores created before per-box results lack the boxes column
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(detections)")}
+                if "boxes" not in columns:
+                    conn.execute("ALTER TABLE detections ADD COLUMN boxes BLOB")
+                # ...and batch marks from before retention lack their time
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(batch_files)")}
+                if "marked_at" not in columns:
+                    conn.execute("ALTER TABLE batch_files ADD COLUMN marked_at TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_batch_files_marked_at ON batch_files (marked_at)")
+            _initialized = True
+    return conn
+
+def init_db():
+    """Create the schema and import any legacy detections.json left from older versions"""
+    _connect()
+    if LEGACY_DB_FILE.exists():
+        migrate_json_store(LEGACY_DB_FILE)
+
+    # Seed the dashboard aggregates from the stored window
+    rolling_stats.rebuild(get_all_detections(hours=rolling_stats.window_minutes / 60))
+
+def _row_to_record(row: sqlite3.Row) -> Dict:
+    """Convert a database row to the record dict used by the rest of the app"""
+    return {
+        "id": row["id"],
+        "timestamp": row["timestamp"],
+        "filename": row["filename"],
+        "has_defect": bool(row["has_defect"]),
+        "confidence": row["confidence"],
+        "defect_type": row["defect_type"],
+        "boxes": row["boxes"]
+    }
+
+def migrate_json_store(json_file: Path = LEGACY_DB_FILE) -> int:
+    """Import records from a legacy detections.json file, then rename it so it only runs once"""
+    json_file = Path(json_file)
+    if not json_file.exists():
+        return 0
+
+    with open(json_file, 'r') as f:
+        records = json.load(f) or []
+
+    # Single transaction, so an interrupted migration leaves the JSON file in place to retry
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "INSERT INTO detections (timestamp, filename, has_defect, confidence, defect_type) VALUES (?, ?, ?, ?, ?)",
+            [
+                (r["timestamp"], r["filename"], int(bool(r["has_defect"])), float(r["confidence"]), r.get("defect_type"))
+                for r in records
+            ]
+        )
+
+    json_file.rename(json_file.with_name(json_file.name + ".migrated"))
+    return len(records)
 
 def load_detections() -> List[Dict]:
-    """Load all detection records from file"""
-    if not DB_FILE.exists():
-        return []
-    
-    with open(DB_FILE, 'r') as f:
-        return json.load(f)
-
-def save_detection(filename: str, has_defect: bool, confidence: float, defect_type: str = None):
-    """Save a new detection record"""
-    detections = load_detections()
-    
+    """Load all detection records, oldest first, including any not yet flushed"""
+    return _with_pending("SELECT * FROM detections ORDER BY timestamp DESC, id DESC", (), lambda r: True)[::-1]
+
+class DetectionWriter:
+    """
+    Write-behind queue for detection records with a single writer thread.
+
+    submit() hands records over and returns at once. The writer commits
+    everything waiting in one transaction as soon as `batch_size` records
+    are queued or the oldest has waited `flush_ms`. Ids are assigned at
+    commit, and committed records are published to live streams in id order.
+    Until then, records are still visible through pending().
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, flush_ms: float = WRITE_FLUSH_MS,
+                 max_pending: int = WRITE_QUEUE_MAX):
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_pending = max_pending
+        self.submitted = 0
+        self.committed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self._groups = deque()
+        self._pending_records = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = None
+        self._cond = threading.Condition()
+        # Held while a flush commits and assigns ids, so readers can tell which pending records are stored
+        self._commit_lock = threading.Lock()
+
+    def submit(self, records: List[Dict], batch_job: str = None):
+        """Queue records to be written together, with their batch_files marks if batch_job is set"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Detection writer is closed")
+            # Only blocks if the store has fallen max_pending records behind
+            while self._pending_records >= self.max_pending:
+                self._cond.wait()
+            self._groups.append((records, batch_job, time.monotonic()))
+            self._pending_records += len(records)
+            self.submitted += len(records)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="detection-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            # Wake the writer when it may be idle (the queue was empty) or when a full batch is ready
+            if len(self._groups) == 1 or self._pending_records >= self.batch_size:
+                self._cond.notify_all()
+
+    def _next_flush(self) -> Optional[List]:
+        """Wait until a flush is due; None once closed and drained"""
+        with self._cond:
+            while not self._groups and not self._closed:
+                self._cond.wait()
+            if not self._groups:
+                return None
+            deadline = self._groups[0][2] + self.flush_ms / 1000
+            while self._pending_records < self.batch_size and not (self._closed or self._flush_requested):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._flush_requested = False
+            return list(self._groups)
+
+    def _commit(self, groups) -> List[Dict]:
+        timestamp = datetime.now().isoformat()
+        conn = _connect()
+        with self._commit_lock:
+            ids = []
+            with conn:
+                for records, batch_job, _ in groups:
+                    for r in records:
+                        cursor = conn.execute(
+                            "INSERT INTO detections (timestamp, filename, has_defect, confidence, defect_type, boxes) VALUES (?, ?, ?, ?, ?, ?)",
+                            (r.setdefault("timestamp", timestamp), r["filename"], int(bool(r["has_defect"])),
+                             float(r["confidence"]), r.get("defect_type"), r.get("boxes"))
+                        )
+                        ids.append(cursor.lastrowid)
+                    if batch_job is not None:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO batch_files (job_id, filename, marked_at) VALUES (?, ?, ?)",
+                            [(batch_job, r["filename"], timestamp) for r in records]
+                        )
+            saved = [r for records, _, _ in groups for r in records]
+            for record, record_id in zip(saved, ids):
+                record["id"] = record_id
+        return saved
+
+    def _run(self):
+        while (groups := self._next_flush()) is not None:
+            try:
+                with timed("flush"):
+                    saved = self._commit(groups)
+            except sqlite3.OperationalError as e:
+                # Locked or I/O trouble: the transaction rolled back as a whole, so keep the records queued and retry
+                self.failures += 1
+                print(f"Detection writer: flush of {sum(len(g[0]) for g in groups)} records failed, retrying: {e}", file=sys.stderr)
+                time.sleep(1)
+                continue
+            except Exception as e:
+                # Records that can never be written must not stall the queue behind them
+                self.failures += 1
+                print(f"Detection writer: dropped {sum(len(g[0]) for g in groups)} records: {e}", file=sys.stderr)
+                saved = []
+
+            with self._cond:
+                for _ in groups:
+                    self._groups.popleft()
+                flushed = sum(len(records) for records, _, _ in groups)
+                self._pending_records -= flushed
+                self.committed += len(saved)
+                self.dropped += flushed - len(saved)
+                self.flushes += 1
+                self._cond.notify_all()
+            # Only this thread publishes, so streams see ids in order
+            live_updates.publish(saved)
+
+    def pending(self) -> List[Dict]:
+        """Records submitted but not yet removed from the queue"""
+        with self._cond:
+            return [r for records, _, _ in self._groups for r in records]
+
+    def unstored(self, waiting: List[Dict], stored_ids: set) -> List[Dict]:
+        """
+        The records of an earlier pending() snapshot missing from a read made since.
+
+        A record committed after that read has an id the read did not return.
+        """
+        with self._commit_lock:
+            return [dict(r) for r in waiting if r.get("id") is None or r["id"] not in stored_ids]
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write everything submitted so far and wait for it; False on timeout"""
+        with self._cond:
+            target = self.submitted
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self.committed + self.dropped >= target, timeout)
+
+    def close(self):
+        """Flush what is queued and stop the writer thread; the shutdown hook"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "pending": self._pending_records,
+                "submitted": self.submitted,
+                "committed": self.committed,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "avg_records_per_flush": self.committed / self.flushes if self.flushes else 0.0,
+                "failures": self.failures
+            }
+
+# Every detection insert goes through this one writer
+detection_writer = DetectionWriter()
+
+@timed("save_detection")
+def save_detection(filename: str, has_defect: bool, confidence: float, defect_type: str = None, boxes: bytes = None):
+    """
+    Queue a new detection record for writing; boxes is a packed DetectionResult with every defect found.
+
+    Returns at once. The record shows up in reads straight away and gets its
+    id when the write-behind queue flushes it.
+    """
     record = {
         "timestamp": datetime.now().isoformat(),
         "filename": filename,
         "has_defect": has_defect,
         "confidence": confidence,
-        "defect_type": defect_type
+        "defect_type": defect_type,
+        "boxes": boxes
     }
-    
-    detections.append(record)
-    
-    with open(DB_FILE, 'w') as f:
-        json.dump(detections, f, indent=2)
+    detection_writer.submit([record])
+    rolling_stats.add(record)
+    count_scan(record)
+
+    return record
+
+@timed("save_detections")
+def save_detections(records: List[Dict], batch_job: str = None) -> List[Dict]:
+    """
+    Queue many detection records to be written in the same transaction.
+
+    Each record needs filename, has_defect, confidence, defect_type and boxes,
+    and may carry its own timestamp (default: now). With batch_job set, the
+    files are also marked done for that job in the same transaction, so an
+    interrupted batch resumes exactly where it stopped. Call
+    detection_writer.flush() to wait until they are stored.
+    """
+    timestamp = datetime.now().isoformat()
+    queued = [dict(r, timestamp=r.get("timestamp", timestamp)) for r in records]
+    detection_writer.submit(queued, batch_job)
+
+    for record in queued:
+        rolling_stats.add(record)
+        count_scan(record)
+    return queued
+
+def _with_pending(query: str, params: tuple, keep) -> List[Dict]:
+    """
+    Run a detections query and add the queued records matching keep, most recent first.
+
+    The queue is read before the table, so a record flushed in between is
+    found in the table and not lost; unstored() drops the duplicates.
+    """
+    waiting = [r for r in detection_writer.pending() if keep(r)]
+    records = [_row_to_record(row) for row in _connect().execute(query, params).fetchall()]
+    if not waiting:
+        return records
+    unstored = detection_writer.unstored(waiting, {r["id"] for r in records})
+    for record in unstored:
+        record.setdefault("id", None)
+    return sorted(records + unstored, key=lambda r: (r["timestamp"], r["id"] or 0), reverse=True)
+
+def get_detections_after(detection_id: int, limit: int = LIVE_CATCHUP_LIMIT) -> List[Dict]:
+    """Detections saved after the given id, oldest first, at most limit of them"""
+    rows = _connect().execute(
+        "SELECT * FROM detections WHERE id > ? ORDER BY id LIMIT ?", (detection_id, limit)
+    ).fetchall()
+    return [_row_to_record(row) for row in rows]
+
+def get_latest_detection_id() -> Optional[int]:
+    row = _connect().execute("SELECT MAX(id) AS id FROM detections").fetchone()
+    return row["id"]
+
+def get_completed_batch_files(batch_job: str, filenames: List[str] = None) -> set:
+    """Filenames a batch job has already recorded, out of filenames if given"""
+    conn = _connect()
+    if filenames is None:
+        rows = conn.execute("SELECT filename FROM batch_files WHERE job_id = ?", (batch_job,)).fetchall()
+        return {row["filename"] for row in rows}
+
+    completed = set()
+    # Stay well below SQLite's limit on bound parameters
+    for i in range(0, len(filenames), 500):
+        chunk = filenames[i:i + 500]
+        rows = conn.execute(
+            f"SELECT filename FROM batch_files WHERE job_id = ? AND filename IN ({', '.join('?' * len(chunk))})",
+            [batch_job, *chunk]
+        ).fetchall()
+        completed.update(row["filename"] for row in rows)
+    return completed
+
+def mark_batch_files(batch_job: str, filenames: List[str]):
+    """Record files as done for a batch job directly, e.g. ones skipped without a detection"""
+    marked_at = datetime.now().isoformat()
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO batch_files (job_id, filename, marked_at) VALUES (?, ?, ?)",
+            [(batch_job, filename, marked_at) for filename in filenames]
+        )
+
+def save_batch_job(job_id: str, root: str, files: List[str]):
+    """Record a batch job before it starts; starting a recorded job again marks it unfinished until it ends"""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO batch_jobs (job_id, root, files, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (job_id) DO UPDATE SET finished_at = NULL",
+            (job_id, root, json.dumps(files), datetime.now().isoformat())
+        )
+
+def finish_batch_job(job_id: str):
+    conn = _connect()
+    with conn:
+        conn.execute("UPDATE batch_jobs SET finished_at = ? WHERE job_id = ?", (datetime.now().isoformat(), job_id))
+
+def _row_to_batch_job(row: sqlite3.Row) -> Dict:
+    return {"job_id": row["job_id"], "root": row["root"], "files": json.loads(row["files"]),
+            "created_at": row["created_at"], "finished_at": row["finished_at"]}
+
+def get_batch_job(job_id: str) -> Optional[Dict]:
+    row = _connect().execute("SELECT * FROM batch_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _row_to_batch_job(row) if row else None
+
+def get_unfinished_batch_jobs() -> List[Dict]:
+    """Recorded jobs that were interrupted before running to the end, oldest first"""
+    rows = _connect().execute(
+        "SELECT * FROM batch_jobs WHERE finished_at IS NULL ORDER BY created_at"
+    ).fetchall()
+    return [_row_to_batch_job(row) for row in rows]
+
+def expire_batch_jobs(before: datetime) -> int:
+    """Delete batch job records created before the given time; returns how many"""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM batch_jobs WHERE created_at < ?", (before.isoformat(),))
+    return cursor.rowcount
+
+def expire_batch_files(before: datetime, limit: int = MAINTENANCE_BATCH_SIZE) -> int:
+    """Delete up to limit batch marks made before the given time (or at an unknown time); returns how many"""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM batch_files WHERE rowid IN "
+            "(SELECT rowid FROM batch_files WHERE marked_at IS NULL OR marked_at < ? LIMIT ?)",
+            (before.isoformat(), limit)
+        )
+    return cursor.rowcount
+
+def get_detection(detection_id: int) -> Optional[Dict]:
+    """Get a single detection record by id"""
+    row = _connect().execute("SELECT * FROM detections WHERE id = ?", (detection_id,)).fetchone()
+    return _row_to_record(row) if row else None
 
 def get_recent_defects(hours: int = 1) -> List[Dict]:
     """Get defects detected in the last N hours"""
-    detections = load_detections()
     cutoff_time = datetime.now() - timedelta(hours=hours)
-    
-    recent_defects = [
-        d for d in detections
-        if d["has_defect"] and datetime.fromisoformat(d["timestamp"]) > cutoff_time
-    ]
-    
+
     # Sort by timestamp, most recent first
-    recent_defects.sort(key=lambda x: x["timestamp"], reverse=True)
-    
-    return recent_defects
+    return _with_pending(
+        "SELECT * FROM detections WHERE timestamp > ? AND has_defect = 1 ORDER BY timestamp DESC, id DESC",
+        (cutoff_time.isoformat(),),
+        lambda r: r["has_defect"] and r["timestamp"] > cutoff_time.isoformat()
+    )
 
 def get_all_detections(hours: int = 24) -> List[Dict]:
     """Get all detections (defect and no defect) from last N hours"""
-    detections = load_detections()
     cutoff_time = datetime.now() - timedelta(hours=hours)
-    
-    recent = [
-        d for d in detections
-        if datetime.fromisoformat(d["timestamp"]) > cutoff_time
-    ]
-    
-    # Sort by timestamp, most recent first
-    recent.sort(key=lambda x: x["timestamp"], reverse=True)
-    
-    return recent
+
+    # Sort by timestamp, most recent first; records still in the write-behind queue are included
+    return _with_pending(
+        "SELECT * FROM detections WHERE timestamp > ? ORDER BY timestamp DESC, id DESC",
+        (cutoff_time.isoformat(),),
+        lambda r: r["timestamp"] > cutoff_time.isoformat()
+    )
+
+def encode_cursor(record: Dict) -> str:
+    """Opaque pagination cursor pointing just past a record"""
+    return f"{record['timestamp']}|{record['id']}"
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """The (timestamp, id) a cursor points past; raises ValueError if it was not made by encode_cursor"""
+    timestamp, _, record_id = cursor.rpartition("|")
+    try:
+        datetime.fromisoformat(timestamp)
+        return timestamp, int(record_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+def get_detections_page(hours: int = 24, cursor: str = None, limit: int = DASHBOARD_PAGE_SIZE) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Get one page of detections from the last N hours, most recent first.
+
+    Pages are keyed on (timestamp, id) rather than an offset, so every page is
+    a single index range scan no matter how deep it is.
+
+    Returns:
+        tuple: (records, cursor for the next page or None on the last page)
+    """
+    cutoff_time = datetime.now() - timedelta(hours=hours)
+    if cursor:
+        timestamp, record_id = decode_cursor(cursor)
+        rows = _connect().execute(
+            "SELECT * FROM detections WHERE timestamp > ? AND (timestamp, id) < (?, ?) "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (cutoff_time.isoformat(), timestamp, record_id, limit + 1)
+        ).fetchall()
+    else:
+        rows = _connect().execute(
+            "SELECT * FROM detections WHERE timestamp > ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (cutoff_time.isoformat(), limit + 1)
+        ).fetchall()
+
+    records = [_row_to_record(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(records[-1]) if len(rows) > limit else None
+    return records, next_cursor
+
+def _rolled_up_id(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM rollup_state WHERE name = 'rolled_up_id'").fetchone()
+    return row["value"] if row else 0
+
+def rollup_detections(limit: int = MAINTENANCE_BATCH_SIZE) -> int:
+    """
+    Count up to limit detections not yet rolled up into the hourly and daily rollups.
+
+    Detections are taken in id order and the last id counted is stored in the
+    same transaction as the counts, so each is counted exactly once, even one
+    saved late with an older timestamp.
+
+    Returns:
+        int: how many detections were counted; fewer than limit means caught up
+    """
+    conn = _connect()
+    with conn:
+        # Take the write lock up front so the id range read below cannot go stale
+        conn.execute("BEGIN IMMEDIATE")
+        start = _rolled_up_id(conn)
+        count, end = conn.execute(
+            "SELECT COUNT(*), MAX(id) FROM (SELECT id FROM detections WHERE id > ? ORDER BY id LIMIT ?)", (start, limit)
+        ).fetchone()
+        if not count:
+            return 0
+        for period, width in ROLLUP_PERIODS.items():
+            conn.execute(
+                "INSERT INTO rollups (period, bucket, defect_type, scans, defects) "
+                "SELECT ?, substr(timestamp, 1, ?), COALESCE(defect_type, ''), COUNT(*), SUM(has_defect) "
+                "FROM detections WHERE id > ? AND id <= ? GROUP BY 2, 3 "
+                "ON CONFLICT (period, bucket, defect_type) DO UPDATE SET "
+                "scans = scans + excluded.scans, defects = defects + excluded.defects",
+                (period, width, start, end)
+            )
+        conn.execute(
+            "INSERT INTO rollup_state (name, value) VALUES ('rolled_up_id', ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (end,)
+        )
+    return count
+
+def expire_detections(before: datetime, limit: int = MAINTENANCE_BATCH_SIZE) -> int:
+    """Delete up to limit detections older than before, skipping any not rolled up yet; returns how many"""
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            "DELETE FROM detections WHERE id IN "
+            "(SELECT id FROM detections WHERE timestamp < ? AND id <= ? ORDER BY timestamp LIMIT ?)",
+            (before.isoformat(), _rolled_up_id(conn), limit)
+        )
+    return cursor.rowcount
+
+def expire_rollups(period: str, before: datetime) -> int:
+    """Delete rollups of one period whose bucket started before the given time"""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM rollups WHERE period = ? AND bucket < ?",
+            (period, before.isoformat()[:ROLLUP_PERIODS[period]])
+        )
+    return cursor.rowcount
+
+def get_referenced_files(filenames: List[str]) -> set:
+    """The given upload filenames that some stored detection still points at"""
+    conn = _connect()
+    referenced = set()
+    # Stay well below SQLite's limit on bound parameters
+    for i in range(0, len(filenames), 500):
+        chunk = filenames[i:i + 500]
+        rows = conn.execute(
+            f"SELECT DISTINCT filename FROM detections WHERE filename IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        referenced.update(row["filename"] for row in rows)
+    return referenced
+
+def get_defect_rates(days: int = ANALYTICS_DAYS, period: str = "day") -> Dict:
+    """
+    Scans, defects and defect rate per defect type over the last `days` days.
+
+    Counts come from the rollups of the given period ("day" or "hour"), plus
+    the detections saved since the last rollup, so the cost depends on the
+    number of buckets and not on how many detections they hold. Records still
+    in the write-behind queue are not included.
+
+    Returns:
+        dict: totals and per-type counts and rates for the whole range, and
+        the same for each bucket under "series", oldest first
+    """
+    width = ROLLUP_PERIODS[period]
+    start = (datetime.now() - timedelta(days=days)).isoformat()[:width]
+    # One statement reads rollups and watermark from the same snapshot, so nothing is counted twice
+    rows = _connect().execute(
+        "SELECT bucket, defect_type, SUM(scans) AS scans, SUM(defects) AS defects FROM ("
+        "SELECT bucket, defect_type, scans, defects FROM rollups WHERE period = ? AND bucket >= ? "
+        "UNION ALL "
+        "SELECT substr(timestamp, 1, ?), COALESCE(defect_type, ''), COUNT(*), SUM(has_defect) FROM detections "
+        "WHERE id > (SELECT COALESCE(MAX(value), 0) FROM rollup_state WHERE name = 'rolled_up_id') "
+        "AND substr(timestamp, 1, ?) >= ? GROUP BY 1, 2"
+        ") GROUP BY bucket, defect_type ORDER BY bucket",
+        (period, start, width, width, start)
+    ).fetchall()
+
+    series = {}
+    for row in rows:
+        bucket = series.setdefault(row["bucket"], {"bucket": row["bucket"], "scans": 0, "defects": 0, "by_type": {}})
+        bucket["scans"] += row["scans"]
+        bucket["defects"] += row["defects"]
+        if row["defects"] and row["defect_type"]:
+            bucket["by_type"][row["defect_type"]] = row["defects"]
+
+    totals = {"scans": 0, "defects": 0, "by_type": {}}
+    for bucket in series.values():
+        totals["scans"] += bucket["scans"]
+        totals["defects"] += bucket["defects"]
+        for defect_type, count in bucket["by_type"].items():
+            totals["by_type"][defect_type] = totals["by_type"].get(defect_type, 0) + count
+
+    def rates(counts: Dict) -> Dict:
+        scans = counts["scans"]
+        return {
+            "scans": scans,
+            "defects": counts["defects"],
+            "defect_rate": counts["defects"] / scans if scans else 0.0,
+            "by_type": {
+                defect_type: {"defects": count, "rate": count / scans}
+                for defect_type, count in sorted(counts["by_type"].items(), key=lambda item: -item[1])
+            }
+        }
+
+    return {"days": days, "period": period, "start": start, **rates(totals),
+            "series": [dict(rates(bucket), bucket=key) for key, bucket in series.items()]}
 
 def clear_all_detections():
-    """Clear all detection history"""
-    with open(DB_FILE, 'w') as f:
-        json.dump([], f)
+    """Clear all detection history, including its rollups"""
+    # Anything already queued counts as history too
+    detection_writer.flush()
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM detections")
+        conn.execute("DELETE FROM rollups")
+    rolling_stats.clear()
+
+if __name__ == "__main__":
+    # One-shot migration: python database.py [path/to/detections.json]
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else LEGACY_DB_FILE
+    print(f"Migrated {migrate_json_store(source)} records from {source} into {DB_FILE}")
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+from config import WORKER_THREADS, WORKER_QUEUE_SIZE
+
+class QueueFullError(Exception):
+    """Raised when work is submitted while the queue is already at capacity"""
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded queue that rejects work instead of queueing it forever.
+
+    At most max_workers tasks run at once and at most max_queue more wait behind
+    them; submit() raises QueueFullError beyond that so callers can shed load.
+    """
+
+    def __init__(self, max_workers: int = WORKER_THREADS, max_queue: int = WORKER_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Schedule fn on the pool, or raise QueueFullError if the queue is full"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"{self._pending} tasks already pending")
+            self._pending += 1
+
+        queued_at = time.perf_counter()
+
+        def task():
+            wait = time.perf_counter() - queued_at
+            with self._lock:
+                self._active += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._pending -= 1
+                    self.completed += 1
+
+        try:
+            return self._pool.submit(task)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the pool and await its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def queue_depth(self) -> int:
+        """Number of tasks waiting for a free worker"""
+        with self._lock:
+            return self._pending - self._active
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            started = self.completed + self._active
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": self._pending - self._active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": 1000 * self.total_wait / started if started else 0.0,
+                "max_wait_ms": 1000 * self.max_wait
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+# Shared pool for model inference and storage I/O
+worker_pool = BoundedExecutor()
@@ -0,0 +1,472 @@
+import itertools
+import math
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Dict, Tuple
+
+import numpy as np
+
+from backends import load_bgr
+from config import (
+    BATCH_MAX_SIZE, MODEL_WARMUP, INFERENCE_SERVER_ADDRESS, INFERENCE_SERVER_AUTHKEY,
+    INFERENCE_SERVER_WORKERS, INFERENCE_SERVER_TIMEOUT_SECONDS, INFERENCE_SHM_SLOTS, INFERENCE_SHM_SLOT_BYTES
+)
+from model import DetectionResult
+from preprocess import PreparedImage
+
+# Message protocol over the local socket (pickled tuples):
+#   server -> client  ("hello", shm_name, slot_bytes, slots)
+#   client -> server  ("infer", req_id, shape)         ask for enough consecutive shared-memory slots
+#   server -> client  ("slot", req_id, slot)           first slot granted (None: can never fit); client writes pixels there
+#   client -> server  ("go", req_id)                   pixels written, run the model
+#   client -> server  ("cancel", req_id)               gave up waiting for slots; release or stop waiting for them
+#   client -> server  ("infer_path", req_id, path)    image too big for the whole segment, read it from disk
+#   client -> server  ("infer_pixels", req_id, array) too big and no file to read, so the pixels come over the socket
+#   server -> client  ("result", req_id, packed_boxes, error)
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    """Attach to the server's segment without letting this process's resource tracker unlink it at exit"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+def _slot_view(shm, slot: int, slot_bytes: int, shape) -> np.ndarray:
+    """A uint8 image array living in shared memory, from the start of a slot and running on into the next ones"""
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+
+def model_worker(worker_id: int, tasks, results, shm_name: str, slot_bytes: int):
+    """
+    Model process: loads the detector once, then runs tasks from its queue.
+
+    Whatever has queued up (up to BATCH_MAX_SIZE) goes through the model as
+    one batch, reading pixels straight out of shared memory.
+    """
+    from model import DefectDetector
+
+    detector = DefectDetector()
+    if MODEL_WARMUP:
+        detector.warmup()
+    # Spawned workers share the server's resource tracker, which owns the segment
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    while True:
+        batch = [tasks.get()]
+        while len(batch) < BATCH_MAX_SIZE and batch[-1] is not None:
+            try:
+                batch.append(tasks.get_nowait())
+            except queue.Empty:
+                break
+        stopping = batch[-1] is None
+        batch = [task for task in batch if task is not None]
+
+        if batch:
+            images = [
+                _slot_view(shm, slot, slot_bytes, shape) if slot is not None else source
+                for _, slot, shape, source in batch
+            ]
+            try:
+                outputs = detector.detect_batch(images)
+                results.put((worker_id, [(key, output.pack(), None) for (key, _, _, _), output in zip(batch, outputs)]))
+            except Exception as e:
+                results.put((worker_id, [(key, None, repr(e)) for key, _, _, _ in batch]))
+            del images
+
+        if stopping:
+            break
+    shm.close()
+
+class _ClientConnection:
+    """One connected web worker; sends are locked because several server threads reply on it"""
+
+    _ids = itertools.count()
+
+    def __init__(self, conn):
+        self.id = next(self._ids)
+        self.conn = conn
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        try:
+            with self._send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError):
+            # Client went away; its results are simply dropped
+            pass
+
+class InferenceServer:
+    """
+    Dispatcher in front of N model processes.
+
+    Owns a shared-memory segment divided into fixed-size slots. Web workers
+    are handed a run of consecutive free slots big enough for their image,
+    write decoded pixels there and send only the first slot number, so image
+    data never crosses the socket. Requests that must wait for slots are
+    granted in arrival order, so large images are not starved. Tasks go to the least busy model
+    process, and a model process that dies is restarted; requests it was
+    holding fail with an error rather than hanging.
+    """
+
+    def __init__(self, address: str = INFERENCE_SERVER_ADDRESS, workers: int = INFERENCE_SERVER_WORKERS,
+                 slots: int = INFERENCE_SHM_SLOTS, slot_bytes: int = INFERENCE_SHM_SLOT_BYTES):
+        self.address = address
+        self.num_workers = workers
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.ctx = mp.get_context("spawn")
+        self.results = self.ctx.Queue()
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._free = [True] * slots
+        self._slot_waiters = deque()
+        self._pending = {}      # key -> (client, slot, count, shape) between "slot" and "go"
+        self._owners = {}       # key -> (client, req_id, slot, count) once dispatched
+        self._workers = {}      # worker_id -> (process, task queue)
+        self._in_flight = {}    # worker_id -> set of keys
+        self._stopping = False
+
+    def _start_worker(self, worker_id: int):
+        """Start (or replace) a model process; called with the lock held"""
+        tasks = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=model_worker,
+            args=(worker_id, tasks, self.results, self.shm.name, self.slot_bytes),
+            name=f"model-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = (process, tasks)
+        self._in_flight[worker_id] = set()
+
+    # Slots
+
+    def _allocate(self, count: int):
+        """Mark the first run of count free slots as used and return its start, or None; called with the lock held"""
+        run = 0
+        for i, free in enumerate(self._free):
+            run = run + 1 if free else 0
+            if run == count:
+                start = i - count + 1
+                self._free[start:i + 1] = [False] * count
+                return start
+        return None
+
+    def _grant_waiting(self):
+        """Give slots to waiting requests in arrival order while they fit; called with the lock held"""
+        grants = []
+        while self._slot_waiters:
+            client, req_id, count, shape = self._slot_waiters[0]
+            slot = self._allocate(count)
+            if slot is None:
+                break
+            self._slot_waiters.popleft()
+            self._pending[(client.id, req_id)] = (client, slot, count, shape)
+            grants.append((client, req_id, slot))
+        return grants
+
+    def _request_slot(self, client: _ClientConnection, req_id, shape):
+        count = max(1, math.ceil(math.prod(shape) / self.slot_bytes))
+        if count > len(self._free):
+            client.send(("slot", req_id, None))
+            return
+        with self._lock:
+            self._slot_waiters.append((client, req_id, count, shape))
+            grants = self._grant_waiting()
+        for waiter, waiter_req_id, slot in grants:
+            waiter.send(("slot", waiter_req_id, slot))
+
+    def _cancel_slots(self, client: _ClientConnection, req_id):
+        """Withdraw a slot request the client stopped waiting for, whether still queued or already granted"""
+        with self._lock:
+            self._slot_waiters = deque(w for w in self._slot_waiters if not (w[0] is client and w[1] == req_id))
+            pending = self._pending.pop((client.id, req_id), None)
+            if pending is not None:
+                _, slot, count, _ = pending
+                self._free[slot:slot + count] = [True] * count
+            grants = self._grant_waiting()
+        for waiter, waiter_req_id, slot in grants:
+            waiter.send(("slot", waiter_req_id, slot))
+
+    def _release_slots(self, slot: int, count: int):
+        """Return slots to the segment and hand them on to waiting requests"""
+        with self._lock:
+            self._free[slot:slot + count] = [True] * count
+            grants = self._grant_waiting()
+        for client, req_id, granted in grants:
+            client.send(("slot", req_id, granted))
+
+    # Dispatch and results
+
+    def _dispatch(self, client: _ClientConnection, req_id, slot, count, shape, source):
+        """Queue a task for the least busy model process; source is the path or pixels when there is no slot"""
+        key = (client.id, req_id)
+        with self._lock:
+            worker_id = min(self._in_flight, key=lambda w: len(self._in_flight[w]))
+            self._in_flight[worker_id].add(key)
+            self._owners[key] = (client, req_id, slot, count)
+            tasks = self._workers[worker_id][1]
+        tasks.put((key, slot, shape, source))
+
+    def _finish(self, key, packed, error):
+        with self._lock:
+            owner = self._owners.pop(key, None)
+        if owner is None:
+            # Already failed by the supervisor after a crash
+            return
+        client, req_id, slot, count = owner
+        client.send(("result", req_id, packed, error))
+        if slot is not None:
+            self._release_slots(slot, count)
+
+    def _collect_results(self):
+        while not self._stopping:
+            try:
+                worker_id, items = self.results.get(timeout=1)
+            except queue.Empty:
+                continue
+            for key, packed, error in items:
+                with self._lock:
+                    self._in_flight.get(worker_id, set()).discard(key)
+                self._finish(key, packed, error)
+
+    def _supervise(self):
+        """Restart model processes that exit, failing the requests they held"""
+        while not self._stopping:
+            time.sleep(1)
+            for worker_id, (process, _) in list(self._workers.items()):
+                if process.is_alive() or self._stopping:
+                    continue
+                with self._lock:
+                    lost = self._in_flight[worker_id]
+                    self._start_worker(worker_id)
+                    self.restarts += 1
+                print(f"Model worker {worker_id} exited with code {process.exitcode}; restarted", flush=True)
+                for key in lost:
+                    self._finish(key, None, f"model worker {worker_id} exited with code {process.exitcode}")
+
+    # Client connections
+
+    def _serve_client(self, conn):
+        client = _ClientConnection(conn)
+        client.send(("hello", self.shm.name, self.slot_bytes, len(self._free)))
+        try:
+            while True:
+                message = conn.recv()
+                kind, req_id = message[0], message[1]
+                if kind == "infer":
+                    self._request_slot(client, req_id, message[2])
+                elif kind == "go":
+                    with self._lock:
+                        pending = self._pending.pop((client.id, req_id), None)
+                    if pending is not None:
+                        _, slot, count, shape = pending
+                        self._dispatch(client, req_id, slot, count, shape, None)
+                elif kind == "cancel":
+                    self._cancel_slots(client, req_id)
+                elif kind in ("infer_path", "infer_pixels"):
+                    self._dispatch(client, req_id, None, 0, None, message[2])
+        except (EOFError, OSError):
+            pass
+        finally:
+            # Slots granted to a departed client but never filled go back to the ring
+            with self._lock:
+                abandoned = [key for key in self._pending if key[0] == client.id]
+                for key in abandoned:
+                    _, slot, count, _ = self._pending.pop(key)
+                    self._free[slot:slot + count] = [True] * count
+                self._slot_waiters = deque(w for w in self._slot_waiters if w[0] is not client)
+                # Freed slots, or a departed waiter at the head of the queue, may let others through
+                grants = self._grant_waiting()
+            for waiter, req_id, slot in grants:
+                waiter.send(("slot", req_id, slot))
+            conn.close()
+
+    def serve_forever(self):
+        with self._lock:
+            for worker_id in range(self.num_workers):
+                self._start_worker(worker_id)
+        threading.Thread(target=self._collect_results, name="results", daemon=True).start()
+        threading.Thread(target=self._supervise, name="supervisor", daemon=True).start()
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        listener = Listener(self.address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY)
+        print(f"Inference server on {self.address} with {self.num_workers} model processes", flush=True)
+        try:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+            listener.close()
+
+    def shutdown(self):
+        self._stopping = True
+        for process, tasks in self._workers.values():
+            tasks.put(None)
+        for process, _ in self._workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.shm.close()
+        self.shm.unlink()
+
+class RemoteDetector:
+    """
+    DefectDetector stand-in for web workers, backed by the inference server.
+
+    Decodes images locally, copies the pixels into shared-memory slots and
+    waits for the packed boxes to come back, so torch is never imported here.
+    A lost connection fails the requests sent on it and the next request
+    reconnects; no wait lasts longer than `timeout` seconds.
+    """
+
+    def __init__(self, address: str = INFERENCE_SERVER_ADDRESS, timeout: float = INFERENCE_SERVER_TIMEOUT_SECONDS):
+        self.address = address
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        # Shared by every connection, so requests made before a reconnect are still found
+        self._results: Dict[int, Future] = {}
+        self._slots: Dict[int, Future] = {}
+        # req_id -> the connection its request went out on, to fail it if that connection drops
+        self._routes: Dict[int, Connection] = {}
+        self._conn = None
+        self._connect()
+
+    def _connect(self):
+        conn = Client(self.address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY)
+        _, shm_name, self.slot_bytes, slots = conn.recv()
+        self.capacity = self.slot_bytes * slots
+        self.shm = _attach_shm(shm_name)
+        self._conn = conn
+        threading.Thread(target=self._read, args=(conn,), name="inference-client", daemon=True).start()
+
+    def _read(self, conn):
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "slot":
+                    # None if the caller already gave up; it has sent a cancel, so the slots are released
+                    granted = self._slots.pop(message[1], None)
+                    if granted is None:
+                        continue
+                    if message[2] is None:
+                        granted.set_exception(RuntimeError("Image does not fit the inference server's shared memory"))
+                    else:
+                        granted.set_result(message[2])
+                elif message[0] == "result":
+                    _, req_id, packed, error = message
+                    with self._lock:
+                        self._routes.pop(req_id, None)
+                    future = self._results.pop(req_id, None)
+                    if future is None:
+                        continue
+                    if error:
+                        future.set_exception(RuntimeError(error))
+                    else:
+                        future.set_result(packed)
+        except (EOFError, OSError):
+            with self._lock:
+                if self._conn is conn:
+                    self._conn = None
+                lost = [req_id for req_id, route in self._routes.items() if route is conn]
+                for req_id in lost:
+                    del self._routes[req_id]
+            for req_id in lost:
+                for future in (self._slots.pop(req_id, None), self._results.pop(req_id, None)):
+                    if future is not None and not future.done():
+                        future.set_exception(ConnectionError("Inference server connection lost"))
+
+    def _send(self, req_id: int, message, conn: Connection = None) -> Connection:
+        """Send a request's message on conn, or on the current connection (reconnecting if it was lost)"""
+        with self._lock:
+            if conn is None:
+                if self._conn is None:
+                    self._connect()
+                conn = self._conn
+            self._routes[req_id] = conn
+            conn.send(message)
+        return conn
+
+    def _forget(self, req_id: int):
+        with self._lock:
+            self._routes.pop(req_id, None)
+        self._results.pop(req_id, None)
+        self._slots.pop(req_id, None)
+
+    def _submit(self, image) -> Tuple[int, Future]:
+        req_id = next(self._ids)
+        result = Future()
+        self._results[req_id] = result
+        try:
+            pixels = load_bgr(image)
+            if pixels.nbytes > self.capacity:
+                # Larger than the whole segment: let the server read the file, or failing that send the pixels
+                path = image.path if isinstance(image, PreparedImage) else image
+                if path is None or isinstance(path, np.ndarray):
+                    self._send(req_id, ("infer_pixels", req_id, pixels))
+                else:
+                    self._send(req_id, ("infer_path", req_id, os.path.abspath(path)))
+                return req_id, result
+
+            slot_granted = Future()
+            self._slots[req_id] = slot_granted
+            conn = self._send(req_id, ("infer", req_id, pixels.shape))
+            try:
+                slot = slot_granted.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # Stop the server holding (or still queueing) slots for a request nobody will fill
+                try:
+                    self._send(req_id, ("cancel", req_id), conn)
+                except OSError:
+                    pass
+                raise TimeoutError(f"No shared-memory slot from the inference server within {self.timeout}s") from None
+            np.copyto(_slot_view(self.shm, slot, self.slot_bytes, pixels.shape), pixels)
+            # The slots belong to this connection's session, so "go" must not go out on a new one
+            self._send(req_id, ("go", req_id), conn)
+            return req_id, result
+        except BaseException:
+            self._forget(req_id)
+            raise
+
+    def _result(self, req_id: int, future: Future) -> bytes:
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._forget(req_id)
+            raise TimeoutError(f"No result from the inference server within {self.timeout}s") from None
+
+    def detect_batch(self, image_paths):
+        """Same contract as DefectDetector.detect_batch: one DetectionResult per image"""
+        requests = [self._submit(image) for image in image_paths]
+        return [DetectionResult.unpack(self._result(req_id, future)) for req_id, future in requests]
+
+    # The server decides between whole-image and tiled inference
+    detect_whole = detect_batch
+
+    def detect(self, image_path):
+        return self.detect_batch([image_path])[0].summary()
+
+    def warmup(self):
+        """Model processes warm themselves up on start"""
+
+if __name__ == "__main__":
+    if not INFERENCE_SERVER_ADDRESS:
+        raise SystemExit("Set INFERENCE_SERVER_ADDRESS in config.py to run the inference server")
+    def stop(signum, frame):
+        # Leave through serve_forever's cleanup so the shared memory is released
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    InferenceServer().serve_forever()
@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from batch_jobs import IMAGE_SUFFIXES, prefetch
+from config import (
+    INGEST_DIR, INGEST_POLL_SECONDS, INGEST_SETTLE_MS, INGEST_HASH_THRESHOLD, INGEST_DEDUPE_WINDOW, INGEST_BATCH_SIZE,
+    INGEST_QUEUE_MAX, INGEST_MAX_BYTES, BATCH_JOB_DECODE_THREADS, METRICS_ENABLED, RETENTION_DAYS
+)
+from database import init_db, save_detections, get_completed_batch_files, mark_batch_files, detection_writer
+from metrics import ingested_total, stage_seconds
+from model import get_detector
+from preprocess import dhash, prepare_image
+from thumbnails import create_thumbnail
+from uploads import store_upload
+
+class DirectoryIngest:
+    """
+    Continuous ingestion of images written into a folder or its subfolders.
+
+    One thread notices new files, from watchdog's file system events when
+    watchdog is installed and by rescanning the folder otherwise. Another
+    takes each file once it has settled, skips it if its difference hash is
+    within `threshold` bits of a recently kept frame, and runs the rest
+    through the model `batch_size` at a time. Results are saved like any
+    other detection, then every file handled is marked done under job_id, so
+    after a restart only new files (and ones that failed) are taken. Files
+    older than retention_days are left alone: by then their marks may have
+    been pruned, and their records expired.
+    """
+
+    def __init__(self, folder, threshold: int = INGEST_HASH_THRESHOLD, window: int = INGEST_DEDUPE_WINDOW,
+                 batch_size: int = INGEST_BATCH_SIZE, settle_ms: float = INGEST_SETTLE_MS,
+                 poll_seconds: float = INGEST_POLL_SECONDS, max_queue: int = INGEST_QUEUE_MAX,
+                 decode_threads: int = BATCH_JOB_DECODE_THREADS, max_bytes: Optional[int] = INGEST_MAX_BYTES,
+                 retention_days: Optional[float] = RETENTION_DAYS, use_watchdog: bool = True):
+        self.folder = Path(folder).resolve()
+        self.job_id = "ingest-" + hashlib.sha1(str(self.folder).encode()).hexdigest()[:16]
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.settle_ms = settle_ms
+        self.poll_seconds = poll_seconds
+        self.max_queue = max_queue
+        self.decode_threads = decode_threads
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.use_watchdog = use_watchdog
+        self.watcher = None
+        self.started = None
+        self.counts = {"processed": 0, "duplicate": 0, "failed": 0, "dropped": 0}
+        self.defects = 0
+        self.last_lag = None
+        self.error = None
+        # Files noticed but not yet taken, with the time they were noticed
+        self._waiting: Dict[str, float] = {}
+        # Every file noticed, with when, so rescans and repeated events add nothing
+        self._known: Dict[str, float] = {}
+        # Hashes of the most recently kept frames
+        self._recent = deque(maxlen=window)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self) -> "DirectoryIngest":
+        """Start watching and processing on daemon threads"""
+        if self._threads:
+            return self
+        self.started = time.time()
+        for target, name in ((self._watch, "ingest-watch"), (self._process_loop, "ingest")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stop taking files and wait for the batch in progress; files still waiting are taken after a restart"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _count(self, outcome: str, amount: int = 1):
+        if not amount:
+            return
+        with self._cond:
+            self.counts[outcome] += amount
+        if METRICS_ENABLED:
+            ingested_total.inc(amount, outcome=outcome)
+
+    def _name(self, path) -> Optional[str]:
+        """The file's name relative to the folder, or None if it is not an image under it"""
+        path = Path(path)
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            return None
+        try:
+            return str(path.relative_to(self.folder))
+        except ValueError:
+            return None
+
+    def _queue(self, names: List[str]):
+        """Queue files for processing, unless already noticed"""
+        with self._cond:
+            now = time.time()
+            for name in names:
+                if name in self._known:
+                    continue
+                self._known[name] = now
+                if len(self._waiting) >= self.max_queue:
+                    # Not marked done, so a restart picks it up again
+                    self._count("dropped")
+                    continue
+                self._waiting[name] = now
+            self._cond.notify()
+
+    def _notice(self, path):
+        """Queue a file reported by a file system event"""
+        name = self._name(path)
+        if name is not None:
+            self._queue([name])
+
+    def _scan(self):
+        """Queue every file in the folder that has not been noticed or processed before"""
+        with self._cond:
+            names = [name for name in map(self._name, self.folder.rglob("*")) if name and name not in self._known]
+        # Only files new to this process are looked up, so a rescan with nothing new costs no queries
+        completed = get_completed_batch_files(self.job_id, names) if names else set()
+        with self._cond:
+            now = time.time()
+            for name in completed:
+                self._known.setdefault(name, now)
+        self._queue([name for name in names if name not in completed])
+
+    def forget(self, before: float):
+        """Drop files noticed before the given time from memory; files still in the folder are noticed again"""
+        with self._cond:
+            self._known = {
+                name: noticed for name, noticed in self._known.items() if noticed >= before or name in self._waiting
+            }
+
+    def _watchdog_observer(self):
+        """A running watchdog observer that reports new files, or None if watchdog is unavailable"""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+
+        notice = self._notice
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    notice(event.src_path)
+
+            def on_moved(self, event):
+                # Writers that finish a file under a temporary name and then rename it
+                if not event.is_directory:
+                    notice(event.dest_path)
+
+        observer = Observer()
+        observer.schedule(Handler(), str(self.folder), recursive=True)
+        try:
+            observer.start()
+        except OSError as e:
+            # e.g. out of inotify watches
+            print(f"Ingest: file events unavailable, polling instead: {e}", file=sys.stderr)
+            return None
+        return observer
+
+    def _watch(self):
+        observer = self._watchdog_observer() if self.use_watchdog else None
+        self.watcher = "watchdog" if observer else "polling"
+        try:
+            # Files already in the folder; the observer is started first so none slip in between
+            self._scan()
+            if observer:
+                self._stop.wait()
+            else:
+                while not self._stop.wait(self.poll_seconds):
+                    self._scan()
+        finally:
+            if observer:
+                observer.stop()
+                observer.join()
+
+    def _next_batch(self) -> Optional[List[Tuple[str, float]]]:
+        """
+        Wait for up to batch_size settled files; None once stopped.
+
+        Returns:
+            list: (name, arrival time) pairs, the arrival time being the
+            file's mtime, or when ingestion started for older files
+        """
+        with self._cond:
+            while not self._stop.is_set():
+                now = time.time()
+                expired = now - self.retention_days * 86400 if self.retention_days is not None else None
+                ready, gone = [], []
+                for name in self._waiting:
+                    try:
+                        mtime = (self.folder / name).stat().st_mtime
+                    except FileNotFoundError:
+                        gone.append(name)
+                        continue
+                    if expired is not None and mtime < expired:
+                        # Past retention: its done-mark may be pruned already, so taking it could repeat old work
+                        gone.append(name)
+                        continue
+                    # Still being written if it changed within the settle time
+                    if now - mtime >= self.settle_ms / 1000:
+                        ready.append((name, max(mtime, self.started)))
+                        if len(ready) >= self.batch_size:
+                            break
+                for name in gone + [name for name, _ in ready]:
+                    del self._waiting[name]
+                if ready:
+                    return ready
+                self._cond.wait(self.settle_ms / 1000 if self._waiting else None)
+            return None
+
+    def _process_loop(self):
+        while (batch := self._next_batch()) is not None:
+            try:
+                self._process(batch)
+            except Exception as e:
+                # e.g. the model failed to load; the files are not marked done, so a restart retries them
+                self._fail(f"batch of {len(batch)} files", e, len(batch))
+
+    def _fail(self, what: str, error: Exception, count: int = 1):
+        """Count and log a failure; failed files are not marked done, so a restart retries them"""
+        self.error = f"{what}: {error}"
+        self._count("failed", count)
+        print(f"Ingest: {what} failed: {error}", file=sys.stderr)
+
+    def _load(self, name: str):
+        """Decode a kept frame, copy it into the upload store and render its thumbnail"""
+        path = self.folder / name
+        prepared = prepare_image(path)
+        with open(path, 'rb') as f:
+            stored = store_upload(f, path.name, max_bytes=self.max_bytes)
+        create_thumbnail(stored, prepared)
+        return prepared, stored
+
+    def _process(self, batch: List[Tuple[str, float]]):
+        names = [name for name, _ in batch]
+        arrived = dict(batch)
+
+        # Hash in parallel, then compare in arrival order so the first of a run of re-captures is the one kept
+        kept, duplicates = [], []
+        for name, digest, error in prefetch(lambda n: dhash(self.folder / n), names, self.decode_threads, len(names)):
+            if error is not None:
+                self._fail(name, error)
+            elif any((digest ^ recent).bit_count() <= self.threshold for recent in self._recent):
+                duplicates.append(name)
+            else:
+                self._recent.append(digest)
+                kept.append(name)
+
+        loaded = []
+        for name, result, error in prefetch(self._load, kept, self.decode_threads, len(kept)):
+            if error is not None:
+                self._fail(name, error)
+            else:
+                loaded.append((name, *result))
+
+        if loaded:
+            results = get_detector().detect_batch([prepared for _, prepared, _ in loaded])
+            records = []
+            for (_, _, stored), result in zip(loaded, results):
+                has_defect, confidence, defect_type = result.summary()
+                records.append({
+                    "filename": stored,
+                    "has_defect": has_defect,
+                    "confidence": confidence,
+                    "defect_type": defect_type,
+                    "boxes": result.pack()
+                })
+            save_detections(records)
+            # Stored before the files are marked done, so a crash can only repeat work, not lose it
+            detection_writer.flush()
+
+            finished = time.time()
+            for name, _, _ in loaded:
+                self.last_lag = finished - arrived[name]
+                if METRICS_ENABLED:
+                    stage_seconds.observe(self.last_lag, stage="ingest_lag")
+            with self._cond:
+                self.defects += sum(r["has_defect"] for r in records)
+
+        mark_batch_files(self.job_id, [name for name, _, _ in loaded] + duplicates)
+        self._count("processed", len(loaded))
+        self._count("duplicate", len(duplicates))
+
+    def lag_seconds(self) -> float:
+        """How long the oldest waiting file has been waiting"""
+        with self._cond:
+            return time.time() - min(self._waiting.values()) if self._waiting else 0.0
+
+    def snapshot(self) -> Dict:
+        lag = self.lag_seconds()
+        with self._cond:
+            return {
+                "folder": str(self.folder),
+                "watcher": self.watcher,
+                "waiting": len(self._waiting),
+                "lag_seconds": lag,
+                "last_lag_seconds": self.last_lag,
+                **self.counts,
+                "defects": self.defects,
+                "error": self.error
+            }
+
+# Started with the app when INGEST_DIR is set
+directory_ingest = DirectoryIngest(INGEST_DIR) if INGEST_DIR else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a folder and run defect detection on every new image")
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--threshold", type=int, default=INGEST_HASH_THRESHOLD,
+                        help="max differing hash bits (of 64) for a frame to count as a re-capture; -1 keeps every frame")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--poll", action="store_true", help="rescan the folder instead of using file system events")
+    args = parser.parse_args()
+
+    init_db()
+    ingest = DirectoryIngest(args.folder, threshold=args.threshold, batch_size=args.batch_size,
+                             use_watchdog=not args.poll).start()
+    try:
+        while True:
+            time.sleep(2)
+            print(json.dumps(ingest.snapshot()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingest.stop()
+        detection_writer.close()
+
+if __name__ == "__main__":
+    main()
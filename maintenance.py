@@ -0,0 +1,144 @@
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+from config import (
+    UPLOAD_DIR, MAINTENANCE_INTERVAL_MINUTES, MAINTENANCE_BATCH_SIZE, RETENTION_DAYS, ROLLUP_HOURLY_RETENTION_DAYS
+)
+from database import (
+    rollup_detections, expire_detections, expire_rollups, expire_batch_files, expire_batch_jobs, get_referenced_files
+)
+from ingest import directory_ingest
+from metrics import timed
+from thumbnails import remove_thumbnail
+
+class MaintenanceJob:
+    """
+    Background upkeep of the detection store, on a daemon thread.
+
+    Each run first counts new detections into the hourly and daily rollups,
+    then deletes raw detections older than retention_days (only ones already
+    counted), uploaded images that old which no remaining detection points at,
+    batch and ingest done-marks and batch job records that old, and hourly
+    rollups past ROLLUP_HOURLY_RETENTION_DAYS. Database work is split into
+    transactions of at most batch_size rows, so the detection writer never
+    waits long for the write lock.
+    """
+
+    def __init__(self, interval_minutes: float = MAINTENANCE_INTERVAL_MINUTES, retention_days: float = RETENTION_DAYS,
+                 batch_size: int = MAINTENANCE_BATCH_SIZE):
+        self.interval_minutes = interval_minutes
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.runs = 0
+        self.rolled_up = 0
+        self.expired_records = 0
+        self.expired_uploads = 0
+        self.expired_marks = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run now and then every interval_minutes until stop()"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Maintenance run failed: {e}", file=sys.stderr)
+            self._stop.wait(self.interval_minutes * 60)
+
+    @timed("maintenance")
+    def run_once(self) -> Dict:
+        """One full pass; returns what it did"""
+        with self._run_lock:
+            started = time.perf_counter()
+            done = {"rolled_up": 0, "expired_records": 0, "expired_uploads": 0, "expired_marks": 0, "expired_jobs": 0,
+                    "expired_rollups": 0}
+
+            while not self._stop.is_set():
+                count = rollup_detections(self.batch_size)
+                done["rolled_up"] += count
+                if count < self.batch_size:
+                    break
+
+            if self.retention_days is not None:
+                cutoff = datetime.now() - timedelta(days=self.retention_days)
+                while not self._stop.is_set():
+                    count = expire_detections(cutoff, self.batch_size)
+                    done["expired_records"] += count
+                    if count < self.batch_size:
+                        break
+                done["expired_uploads"] = self.expire_uploads(cutoff)
+                while not self._stop.is_set():
+                    count = expire_batch_files(cutoff, self.batch_size)
+                    done["expired_marks"] += count
+                    if count < self.batch_size:
+                        break
+                done["expired_jobs"] = expire_batch_jobs(cutoff)
+                if directory_ingest is not None:
+                    # Ingest skips files this old, so it no longer needs to remember them
+                    directory_ingest.forget(cutoff.timestamp())
+
+            done["expired_rollups"] = expire_rollups("hour", datetime.now() - timedelta(days=ROLLUP_HOURLY_RETENTION_DAYS))
+
+            self.runs += 1
+            self.rolled_up += done["rolled_up"]
+            self.expired_records += done["expired_records"]
+            self.expired_uploads += done["expired_uploads"]
+            self.expired_marks += done["expired_marks"]
+            self.last_run = datetime.now().isoformat()
+            self.last_duration = time.perf_counter() - started
+            self.last_error = None
+            return done
+
+    def expire_uploads(self, cutoff: datetime) -> int:
+        """Delete uploads (and their thumbnails) last written before cutoff that no detection refers to"""
+        cutoff_time = cutoff.timestamp()
+        candidates = []
+        for path in UPLOAD_DIR.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff_time:
+                    candidates.append(path.name)
+            except FileNotFoundError:
+                continue
+
+        referenced = get_referenced_files(candidates)
+        removed = 0
+        for name in candidates:
+            if name in referenced:
+                continue
+            (UPLOAD_DIR / name).unlink(missing_ok=True)
+            remove_thumbnail(name)
+            removed += 1
+        return removed
+
+    def snapshot(self) -> Dict:
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+            "rolled_up": self.rolled_up,
+            "expired_records": self.expired_records,
+            "expired_uploads": self.expired_uploads,
+            "expired_marks": self.expired_marks,
+            "retention_days": self.retention_days
+        }
+
+# Started with the app when MAINTENANCE_ENABLED
+maintenance = MaintenanceJob()
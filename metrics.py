@@ -0,0 +1,168 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+
+from config import METRICS_ENABLED, METRICS_WINDOW
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+def _label_text(labels: Tuple) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+def _sample(name: str, labels: Tuple, value) -> str:
+    return f"{name}{{{_label_text(labels)}}} {value}" if labels else f"{name} {value}"
+
+class Timer:
+    """
+    Latency summary per label set: total count and sum, plus p50/p95/p99
+    over the most recent window of observations.
+
+    observe() is an append under a lock; quantiles are only computed when
+    the metrics are read.
+    """
+
+    def __init__(self, name: str, documentation: str, window: int = METRICS_WINDOW):
+        self.name = name
+        self.documentation = documentation
+        self.window = window
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0, 0.0, deque(maxlen=self.window)]
+            series[0] += 1
+            series[1] += seconds
+            series[2].append(seconds)
+
+    def _read(self):
+        with self._lock:
+            return [(key, count, total, sorted(recent)) for key, (count, total, recent) in self._series.items()]
+
+    @staticmethod
+    def _quantile(ordered, q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def snapshot(self) -> Dict:
+        """Per label set, in milliseconds, keyed by the label values joined with '/'"""
+        snapshot = {}
+        for key, count, total, ordered in self._read():
+            entry = {"count": count, "avg_ms": 1000 * total / count}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}_ms"] = 1000 * self._quantile(ordered, q)
+            snapshot["/".join(str(value) for _, value in key)] = entry
+        return snapshot
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} summary"]
+        for key, count, total, ordered in self._read():
+            for q in QUANTILES:
+                lines.append(_sample(self.name, key + (("quantile", q),), self._quantile(ordered, q)))
+            lines.append(_sample(f"{self.name}_sum", key, total))
+            lines.append(_sample(f"{self.name}_count", key, count))
+        return lines
+
+class Counter:
+    """Monotonic count per label set"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(_sample(self.name, key, value) for key, value in values)
+        return lines
+
+stage_seconds = Timer("defect_stage_seconds", "Time spent in each stage of handling a scan")
+scans_total = Counter("defect_scans_total", "Scans recorded, by result")
+defects_total = Counter("defect_detections_total", "Scans recorded as defective, by defect class")
+
+ingested_total = Counter("defect_ingest_files_total", "Files seen by directory ingestion, by outcome")
+
+METRICS = [stage_seconds, scans_total, defects_total, ingested_total]
+
+class timed:
+    """
+    Record elapsed time into stage_seconds for one stage.
+
+    Use as a context manager (with timed("save"): ...) or as a decorator
+    (@timed("save")) on a plain or async function. Does nothing when
+    METRICS_ENABLED is off.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if METRICS_ENABLED:
+            stage_seconds.observe(time.perf_counter() - self.started, stage=self.stage)
+
+    def __call__(self, fn):
+        if not METRICS_ENABLED:
+            return fn
+        stage = self.stage
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    stage_seconds.observe(time.perf_counter() - started, stage=stage)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stage_seconds.observe(time.perf_counter() - started, stage=stage)
+        return wrapper
+
+def count_scan(record: Dict):
+    """Count a saved detection record by result and defect class"""
+    if not METRICS_ENABLED:
+        return
+    if record["has_defect"]:
+        scans_total.inc(result="defect")
+        defects_total.inc(defect_type=record.get("defect_type") or "unknown")
+    else:
+        scans_total.inc(result="clean")
+
+def render_metrics(gauges: List[Tuple[str, str, float]] = ()) -> str:
+    """
+    All metrics in Prometheus text exposition format.
+
+    gauges are (name, help, value) read by the caller at scrape time;
+    a None value is left out.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, documentation, value in gauges:
+        if value is None:
+            continue
+        lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {float(value)}"])
+    return "\n".join(lines) + "\n"
@@ -1,19 +1,119 @@
-from ultralytics import YOLO
-from config import MODEL_PATH
+import threading
+import time
+
+import numpy as np
+
+from backends import create_backend, load_bgr, nms
+from config import (
+    CONF_THRESHOLD, IOU_THRESHOLD, CLASS_CONF_THRESHOLDS, MAX_DETECTIONS,
+    MODEL_WARMUP, MODEL_WARMUP_SIZE, INFERENCE_SERVER_ADDRESS,
+    TILED_INFERENCE, TILE_MIN_PIXELS, TILE_SIZE, TILE_OVERLAP, TILE_BATCH_SIZE, TILE_MERGE_THRESHOLD
+)
+from metrics import timed
+from preprocess import PreparedImage
+
+# Defect class mapping
+DEFECT_NAMES = {
+    0: 'missing_hole',
+    1: 'mouse_bite',
+    2: 'open_circuit',
+    3: 'short',
+    4: 'spur',
+    5: 'spurious_copper'
+}
+
+# Confidence threshold per class id, indexed by class so filtering is a single gather
+CLASS_THRESHOLDS = np.array(
+    [CLASS_CONF_THRESHOLDS.get(DEFECT_NAMES[i], CONF_THRESHOLD) for i in range(len(DEFECT_NAMES))],
+    dtype=np.float32
+)
+
+def tile_origins(length: int, tile: int, overlap: float):
+    """Start offsets of overlapping tiles covering [0, length), the last one flush with the edge"""
+    if length <= tile:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    origins = list(range(0, length - tile, step))
+    origins.append(length - tile)
+    return origins
+
+class DetectionResult:
+    """
+    All defect boxes found on one image, held as parallel NumPy arrays.
+    
+    boxes is (N, 4) xyxy pixels, confidences is (N,) and class_ids is (N,),
+    sorted by confidence with the most confident box first.
+    """
+    
+    # Packed layout: one float32 row of x1, y1, x2, y2, confidence, class_id per box
+    PACKED_COLUMNS = 6
+    
+    def __init__(self, boxes, confidences, class_ids):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+    
+    @classmethod
+    def from_raw(cls, data, max_detections: int = MAX_DETECTIONS):
+        """Apply per-class thresholds and top-k to raw (N, 6) model output"""
+        data = np.asarray(data, dtype=np.float32).reshape(-1, cls.PACKED_COLUMNS)
+        class_ids = data[:, 5].astype(np.int64)
+        
+        # Unknown class ids fall back to the global threshold
+        known = (class_ids >= 0) & (class_ids < len(CLASS_THRESHOLDS))
+        thresholds = np.where(known, CLASS_THRESHOLDS[np.clip(class_ids, 0, len(CLASS_THRESHOLDS) - 1)], CONF_THRESHOLD)
+        data = data[data[:, 4] >= thresholds]
+        
+        order = np.argsort(-data[:, 4], kind="stable")[:max_detections]
+        data = data[order]
+        return cls(data[:, :4], data[:, 4], data[:, 5])
+    
+    def __len__(self):
+        return len(self.confidences)
+    
+    def summary(self):
+        """The single-defect view used throughout the app: (has_defect, confidence, defect_type)"""
+        if len(self) == 0:
+            return False, 0.0, None
+        return True, float(self.confidences[0]), DEFECT_NAMES.get(int(self.class_ids[0]), 'unknown')
+    
+    def class_counts(self):
+        """Number of boxes per defect type, most frequent first"""
+        if len(self) == 0:
+            return {}
+        ids, counts = np.unique(self.class_ids, return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        return {DEFECT_NAMES.get(int(ids[i]), 'unknown'): int(counts[i]) for i in order}
+    
+    def pack(self) -> bytes:
+        """Serialize to a compact float32 blob for storage"""
+        data = np.empty((len(self), self.PACKED_COLUMNS), dtype=np.float32)
+        data[:, :4] = self.boxes
+        data[:, 4] = self.confidences
+        data[:, 5] = self.class_ids
+        return data.tobytes()
+    
+    @classmethod
+    def unpack(cls, blob: bytes):
+        """Inverse of pack(); an empty or missing blob means no boxes"""
+        data = np.frombuffer(blob or b"", dtype=np.float32).reshape(-1, cls.PACKED_COLUMNS)
+        return cls(data[:, :4], data[:, 4], data[:, 5])
 
 class DefectDetector:
-    # Defect class mapping
-    DEFECT_NAMES = {
-        0: 'missing_hole',
-        1: 'mouse_bite',
-        2: 'open_circuit',
-        3: 'short',
-        4: 'spur',
-        5: 'spurious_copper'
-    }
-    
-    def __init__(self):
-        self.model = YOLO(MODEL_PATH)
+    DEFECT_NAMES = DEFECT_NAMES
+    
+    def __init__(self, backend=None):
+        # The configured backend (ultralytics by default) only loads its runtime here
+        self.backend = backend or create_backend()
+        # Backends are not safe to call from several threads at once
+        self._lock = threading.Lock()
+        # Let every box over the lowest per-class threshold through; from_raw() applies the rest
+        self.model_conf = float(CLASS_THRESHOLDS.min(initial=CONF_THRESHOLD))
+    
+    def warmup(self):
+        """Run one inference on a blank image so the first real request skips one-time setup"""
+        blank = np.zeros((MODEL_WARMUP_SIZE, MODEL_WARMUP_SIZE, 3), dtype=np.uint8)
+        self.detect_whole([blank])
     
     def detect(self, image_path):
         """
@@ -22,18 +122,130 @@ class DefectDetector:
         Returns:
             tuple: (has_defect: bool, confidence: float, defect_type: str or None)
         """
-        results = self.model(str(image_path))
+        return self.detect_batch([image_path])[0].summary()
+    
+    @timed("inference")
+    def detect_batch(self, image_paths):
+        """
+        Run defect detection on several images in a single model call.
         
-        has_defect = len(results[0].boxes) > 0
-        confidence = float(results[0].boxes.conf[0]) if has_defect else 0.0
-        defect_type = None
+        With TILED_INFERENCE on, images over TILE_MIN_PIXELS go through
+        detect_tiled() instead so small defects survive.
         
-        if has_defect:
-            # Get the class of the first detected defect
-            class_id = int(results[0].boxes.cls[0])
-            defect_type = self.DEFECT_NAMES.get(class_id, 'unknown')
+        Returns:
+            list: one DetectionResult per image, in input order
+        """
+        results = [None] * len(image_paths)
+        whole = []
+        for i, path in enumerate(image_paths):
+            if TILED_INFERENCE and self._pixel_count(path) >= TILE_MIN_PIXELS:
+                results[i] = self.detect_tiled(path)
+            else:
+                whole.append(i)
+        
+        if whole:
+            outputs = self.detect_whole([image_paths[i] for i in whole])
+            for i, output in zip(whole, outputs):
+                results[i] = output
+        return results
+    
+    def detect_whole(self, images):
+        """Run the model on full images (paths or decoded BGR arrays), each downscaled to the model input size"""
+        with self._lock:
+            outputs = self.backend.predict(images, conf=self.model_conf, iou=IOU_THRESHOLD)
+        return [DetectionResult.from_raw(output) for output in outputs]
+    
+    def detect_tiled(self, image_path, tile_size: int = TILE_SIZE, overlap: float = TILE_OVERLAP,
+                     batch_size: int = TILE_BATCH_SIZE):
+        """
+        Run detection on overlapping tiles at the model's native resolution.
+        
+        Tile boxes are shifted back to full-image coordinates and duplicates
+        along tile borders are merged with NMS on intersection over the
+        smaller box (TILE_MERGE_THRESHOLD).
+        
+        Returns:
+            DetectionResult: boxes in full-image pixel coordinates
+        """
+        pixels = load_bgr(image_path)
         
-        return has_defect, confidence, defect_type
+        height, width = pixels.shape[:2]
+        origins = [(x, y) for y in tile_origins(height, tile_size, overlap) for x in tile_origins(width, tile_size, overlap)]
+        
+        detections = []
+        for start in range(0, len(origins), batch_size):
+            batch = origins[start:start + batch_size]
+            tiles = [np.ascontiguousarray(pixels[y:y + tile_size, x:x + tile_size]) for x, y in batch]
+            with self._lock:
+                outputs = self.backend.predict(tiles, conf=self.model_conf, iou=IOU_THRESHOLD, imgsz=tile_size)
+            for (x, y), data in zip(batch, outputs):
+                data = data.copy()
+                data[:, [0, 2]] += x
+                data[:, [1, 3]] += y
+                detections.append(data)
+        
+        data = np.concatenate(detections) if detections else np.empty((0, 6), dtype=np.float32)
+        keep = nms(data[:, :4], data[:, 4], data[:, 5].astype(np.int64), TILE_MERGE_THRESHOLD, by_smaller=True)
+        return DetectionResult.from_raw(data[keep])
+    
+    @staticmethod
+    def _pixel_count(image_path) -> int:
+        """Image size from the decoded pixels or the file header, without decoding anything"""
+        from PIL import Image
+        
+        if isinstance(image_path, (np.ndarray, PreparedImage)):
+            height, width = load_bgr(image_path).shape[:2]
+            return height * width
+        with Image.open(image_path) as img:
+            return img.width * img.height
+
+# Shared detector, built on first use or by load_in_background()
+_detector = None
+_load_lock = threading.Lock()
+load_error = None
+load_seconds = None
 
-# Initialize detector instance
-detector = DefectDetector()
+def get_detector() -> DefectDetector:
+    """
+    Return the shared detector, loading (and warming up) the model on first call.
+    
+    With INFERENCE_SERVER_ADDRESS set, this is a client of the out-of-process
+    inference server instead, and this process never loads the model.
+    """
+    global _detector, load_error, load_seconds
+    if _detector is not None:
+        return _detector
+    
+    with _load_lock:
+        if _detector is None:
+            started = time.perf_counter()
+            try:
+                if INFERENCE_SERVER_ADDRESS:
+                    from inference_server import RemoteDetector
+                    detector = RemoteDetector(INFERENCE_SERVER_ADDRESS)
+                else:
+                    detector = DefectDetector()
+                    if MODEL_WARMUP:
+                        detector.warmup()
+            except Exception as e:
+                load_error = e
+                raise
+            load_error = None
+            load_seconds = time.perf_counter() - started
+            _detector = detector
+    return _detector
+
+def is_ready() -> bool:
+    """Whether the model is loaded and can serve requests immediately"""
+    return _detector is not None
+
+def load_in_background():
+    """Start loading the model on a daemon thread so the server can bind right away"""
+    def load():
+        try:
+            get_detector()
+        except Exception:
+            # Recorded in load_error and reported by the readiness endpoint
+            pass
+    
+    threading.Thread(target=load, name="model-loader", daemon=True).start()
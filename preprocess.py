@@ -0,0 +1,101 @@
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import METRICS_ENABLED
+from metrics import stage_seconds
+
+# EXIF tag holding the camera orientation (1 = upright)
+EXIF_ORIENTATION = 0x0112
+
+def letterbox(image: np.ndarray, size):
+    """
+    Resize keeping aspect ratio and pad to size with gray, as ultralytics does.
+
+    Returns:
+        tuple: (padded (H, W, 3) BGR array, scale, (pad_x, pad_y))
+    """
+    height, width = image.shape[:2]
+    target_h, target_w = size
+    scale = min(target_h / height, target_w / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    if (new_w, new_h) != (width, height):
+        image = np.asarray(Image.fromarray(image).resize((new_w, new_h), Image.BILINEAR))
+
+    pad_x, pad_y = (target_w - new_w) / 2, (target_h - new_h) / 2
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    canvas = np.full((target_h, target_w, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = image
+    return canvas, scale, (left, top)
+
+class PreparedImage:
+    """
+    An upload decoded once, with everything later stages need from the pixels.
+
+    pixels is the upright (EXIF-rotated) BGR uint8 array the backends take;
+    timings holds this image's per-stage times in milliseconds.
+    """
+
+    def __init__(self, path, pixels: np.ndarray, orientation: int, image_format: str):
+        self.path = Path(path) if path is not None else None
+        self.pixels = pixels
+        self.height, self.width = pixels.shape[:2]
+        self.orientation = orientation
+        self.format = image_format
+        self.timings: Dict[str, float] = {}
+        self._model_inputs = {}
+
+    def record(self, stage: str, started: float):
+        """Record the time since started (a perf_counter value) for one stage"""
+        seconds = time.perf_counter() - started
+        self.timings[stage] = 1000 * seconds
+        if METRICS_ENABLED:
+            stage_seconds.observe(seconds, stage=stage)
+
+    def metadata(self) -> Dict:
+        return {"width": self.width, "height": self.height, "orientation": self.orientation, "format": self.format}
+
+    def model_input(self, size):
+        """The letterboxed model input at size (H, W), computed once per size"""
+        if size not in self._model_inputs:
+            started = time.perf_counter()
+            self._model_inputs[size] = letterbox(self.pixels, size)
+            self.record("letterbox", started)
+        return self._model_inputs[size]
+
+    def thumbnail(self, size) -> Image.Image:
+        """A downscaled RGB copy for the dashboard, made from the decoded pixels"""
+        started = time.perf_counter()
+        thumb = Image.fromarray(np.ascontiguousarray(self.pixels[:, :, ::-1]))
+        thumb.thumbnail(size)
+        self.record("thumbnail", started)
+        return thumb
+
+def dhash(path, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image file: hash_size**2 bits, one per pair of
+    horizontally adjacent cells of a small grayscale copy.
+
+    Near-identical frames differ in only a few bits. JPEGs are decoded at
+    reduced scale, which makes this much cheaper than prepare_image().
+    """
+    with Image.open(path) as img:
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        cells = np.asarray(img.convert("L").resize((hash_size + 1, hash_size), Image.BOX), dtype=np.int16)
+    bits = (cells[:, 1:] > cells[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def prepare_image(path) -> PreparedImage:
+    """Decode an image file once into a PreparedImage"""
+    started = time.perf_counter()
+    with Image.open(path) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        image_format = img.format
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        pixels = np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+    prepared = PreparedImage(path, pixels, orientation, image_format)
+    prepared.record("decode", started)
+    return prepared
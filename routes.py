@@ -1,10 +1,32 @@
 from fasthtml.common import *
-from model import detector
-from config import UPLOAD_DIR
-from database import save_detection, get_recent_defects, get_all_detections, clear_all_detections
+from batching import batcher
+from batch_jobs import BatchJob, find_job, start_batch, upload_job_id
+from cache import result_cache
+import model
+from config import (
+    UPLOAD_DIR, MAX_UPLOAD_BYTES, RETRY_AFTER_SECONDS, LIVE_CATCHUP_LIMIT, LIVE_STATS_REFRESH_SECONDS, LIVE_MAX_CARDS,
+    ANALYTICS_DAYS
+)
+from executor import QueueFullError, worker_pool
+from metrics import render_metrics, stage_seconds, timed
+from preprocess import prepare_image
+from broadcast import TooManySubscribersError, live_updates
+from database import (
+    save_detection, get_detection, get_detections_page, get_detections_after, get_latest_detection_id, get_defect_rates,
+    detection_writer, encode_cursor, decode_cursor, ROLLUP_PERIODS
+)
+from maintenance import maintenance
+from ingest import directory_ingest
+from stats import rolling_stats
+from thumbnails import create_thumbnail, get_thumbnail, thumbnail_media_type
+from uploads import UploadTooLargeError, store_upload, upload_path
+from starlette.responses import FileResponse
 from datetime import datetime
-import base64
 import json
+import asyncio
+import time
+import mimetypes
+from urllib.parse import quote
 
 def dashboard_button():
     """Reusable dashboard button component"""
@@ -55,18 +77,19 @@ def home_page():
     )
 
 
+@timed("preview")
 async def preview_handler(image: UploadFile):
     """Handle image upload and show preview"""
     if not image:
         return Div(P("Please upload an image", style="color: red;"))
     
-    # Save uploaded file
-    file_path = UPLOAD_DIR / image.filename
-    content = await image.read()
-    file_path.write_bytes(content)
-    
-    # Create base64 image for preview
-    img_data = base64.b64encode(content).decode()
+    # Stream the upload to disk under a content-addressed name
+    try:
+        filename = await worker_pool.run(store_upload, image.file, image.filename)
+    except UploadTooLargeError:
+        return Response(f"Image is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB", status_code=413)
+    except QueueFullError:
+        return server_busy_response()
     
     return Title("AI Defect Detection"), Main(
         dashboard_button(),
@@ -76,12 +99,13 @@ async def preview_handler(image: UploadFile):
         ),
         Div(
             Div(
-                Img(src=f"data:image/jpeg;base64,{img_data}", cls="preview-image"),
+                # A query parameter, so FastHTML's extension-based static route never claims it
+                Img(src=f"/upload?filename={quote(filename)}", cls="preview-image"),
                 cls="preview-container"
             ),
             Form(
                 Button(" Analyze Image", type="submit", cls="analyze-btn"),
-                Input(type="hidden", name="filename", value=image.filename),
+                Input(type="hidden", name="filename", value=filename),
                 method="post",
                 action="/analyze",
                 cls="analyze-form"
@@ -92,15 +116,62 @@ async def preview_handler(image: UploadFile):
         Script("lucide.createIcons();")
     )
 
+def format_defect_type(defect_type):
+    return defect_type.replace('_', ' ').title() if defect_type else "Unknown"
+
+def defect_badges(defect_counts, badge_cls):
+    """One badge per defect type, with a count when the type appears more than once"""
+    return [
+        Span(f"{format_defect_type(t)} ×{n}" if n > 1 else format_defect_type(t), cls=badge_cls)
+        for t, n in defect_counts.items()
+    ]
+
+def server_busy_response():
+    """503 telling the client when to retry"""
+    return Response(
+        "Server is busy, please retry shortly",
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+@timed("analyze")
 async def analyze_handler(filename: str):
     """Handle analysis of uploaded image"""
-    file_path = UPLOAD_DIR / filename
+    file_path = upload_path(filename)
+    if file_path is None or not file_path.exists():
+        return Response("Unknown upload", status_code=404)
     
-    # Run detection
-    has_defect, confidence, defect_type = detector.detect(file_path)
+    try:
+        # Re-submitted images are answered from the result cache, without decoding them
+        image_hash, result = await worker_pool.run(result_cache.lookup_file, file_path)
+        prepared = None
+        if result is None:
+            # Decode once; the model and the thumbnail both use these pixels
+            prepared = await worker_pool.run(prepare_image, file_path)
+            # Run detection, batched together with any concurrent requests
+            started = time.perf_counter()
+            result = await batcher.detect(prepared)
+            prepared.record("detect", started)
+            await worker_pool.run(result_cache.put, image_hash, result)
+        has_defect, confidence, defect_type = result.summary()
+        defect_counts = result.class_counts()
+        
+        # Save detection result, with every box found, to database
+        await worker_pool.run(save_detection, filename, has_defect, confidence, defect_type, result.pack())
+    except QueueFullError:
+        # Shed load instead of letting latency pile up
+        return server_busy_response()
     
-    # Save detection result to database
-    save_detection(filename, has_defect, confidence, defect_type)
+    # The scan is recorded now, so a full queue must not turn into a 503 the client would retry
+    try:
+        if prepared is not None:
+            await worker_pool.run(create_thumbnail, filename, prepared)
+        else:
+            # Only decodes if the thumbnail is not cached already
+            await worker_pool.run(get_thumbnail, filename)
+    except QueueFullError:
+        # /thumb renders it on first request instead
+        pass
     
     # Format results
     if has_defect:
@@ -111,6 +182,8 @@ async def analyze_handler(filename: str):
         # Format defect type for display
         defect_display = defect_type.replace('_', ' ').title() if defect_type else "Unknown"
         detail = f"Type: {defect_display} | Confidence: {confidence:.2%}"
+        if len(result) > 1:
+            detail += f" | {len(result)} defects found"
     else:
         result_text = "NO DEFECT"
         result_icon = I(**{"data-lucide": "check-circle"}, cls="result-icon-svg")
@@ -130,7 +203,7 @@ async def analyze_handler(filename: str):
                 Div(result_icon, cls="result-icon"),
                 H2(result_text, style=f"color: {result_color};", cls="result-title"),
                 Div(
-                    Span(defect_display, cls="defect-type-badge") if defect_display else None,
+                    *defect_badges(defect_counts, "defect-type-badge"),
                     cls="defect-badges-container"
                 ) if has_defect else None,
                 P(detail, cls="result-detail"),
@@ -143,111 +216,170 @@ async def analyze_handler(filename: str):
         Script("lucide.createIcons();")
     )
 
-def dashboard_page():
-    """Show dashboard of recent detections"""
-    all_recent = get_all_detections(hours=1)
-    
-    # Calculate statistics
-    total_scans = len(all_recent)
-    total_defects = len([d for d in all_recent if d["has_defect"]])
-    total_clean = total_scans - total_defects
+def detection_card(detection):
+    """Expandable dashboard card for one detection record"""
+    idx = detection["id"]
+    is_defect = detection["has_defect"]
+    timestamp = datetime.fromisoformat(detection["timestamp"])
+    defect_type = detection.get("defect_type")
+    defect_display = defect_type.replace('_', ' ').title() if defect_type else "Unknown"
+    has_image = (UPLOAD_DIR / detection["filename"]).exists()
+    # Records saved before per-box results only know their top defect
+    boxes = model.DetectionResult.unpack(detection.get("boxes"))
+    board_counts = boxes.class_counts() or ({defect_type: 1} if defect_type else {})
     
-    # Calculate defect type distribution
-    defect_counts = {}
-    for d in all_recent:
-        if d["has_defect"] and d.get("defect_type"):
-            defect_type = d["defect_type"]
-            defect_counts[defect_type] = defect_counts.get(defect_type, 0) + 1
-    
-    # Create detection cards with expandable details
-    if all_recent:
-        detection_cards = []
-        for idx, detection in enumerate(all_recent):
-            is_defect = detection["has_defect"]
-            timestamp = datetime.fromisoformat(detection["timestamp"])
-            defect_type = detection.get("defect_type")
-            defect_display = defect_type.replace('_', ' ').title() if defect_type else "Unknown"
-            
-            # Read image for thumbnail
-            img_path = UPLOAD_DIR / detection["filename"]
-            img_data = ""
-            if img_path.exists():
-                img_data = base64.b64encode(img_path.read_bytes()).decode()
-            
-            card = Div(
+    return Div(
+        Div(
+            # Thumbnail
+            Div(
+                Img(src=f"/thumb/{idx}", loading="lazy", cls="detection-thumbnail") if has_image else Div(cls="detection-thumbnail-placeholder"),
+                cls="thumbnail-container"
+            ),
+            # Info
+            Div(
                 Div(
-                    # Thumbnail
-                    Div(
-                        Img(src=f"data:image/jpeg;base64,{img_data}", cls="detection-thumbnail") if img_data else Div(cls="detection-thumbnail-placeholder"),
-                        cls="thumbnail-container"
-                    ),
-                    # Info
-                    Div(
-                        Div(
-                            I(**{"data-lucide": "alert-triangle" if is_defect else "check-circle"}),
-                            Span(detection["filename"], cls="detection-filename"),
-                            cls="detection-name"
-                        ),
-                        Div(
-                            I(**{"data-lucide": "clock"}, style="width: 14px; height: 14px; margin-right: 4px;"),
-                            Span(timestamp.strftime("%d %b at %H:%M"), cls="detection-time"),
-                            cls="detection-timestamp"
-                        ),
-                        cls="detection-info"
-                    ),
-                    # Badge and expand button
-                    Div(
-                        Div(
-                            Span(defect_display, cls="detection-badge badge-defect") if is_defect and defect_type else Span("Clean", cls="detection-badge badge-clean"),
-                            cls="badge-group"
-                        ),
-                        Button(
-                            I(**{"data-lucide": "chevron-down"}, cls="expand-icon"),
-                            cls="expand-button",
-                            onclick=f"document.getElementById('details-{idx}').classList.toggle('hidden'); this.querySelector('.expand-icon').style.transform = document.getElementById('details-{idx}').classList.contains('hidden') ? 'rotate(0deg)' : 'rotate(180deg)';"
-                        ),
-                        cls="detection-actions"
-                    ),
-                    cls="detection-card-header"
+                    I(**{"data-lucide": "alert-triangle" if is_defect else "check-circle"}),
+                    Span(detection["filename"], cls="detection-filename"),
+                    cls="detection-name"
                 ),
-                # Expandable details
                 Div(
-                    Div(
-                        Img(src=f"data:image/jpeg;base64,{img_data}", cls="detection-full-image") if img_data else Div(),
-                        cls="detection-image-container"
-                    ),
-                    Div(
-                        Div(
-                            Span("Confidence", cls="detail-label"),
-                            Span(f"{detection['confidence']:.0%}", cls="detail-value"),
-                            cls="detail-row"
-                        ),
-                        Div(
-                            Span("Defect Type", cls="detail-label"),
-                            Span(defect_display if defect_type else "N/A", cls="detail-value"),
-                            cls="detail-row"
-                        ) if is_defect else None,
-                        Div(
-                            Span("Analysis", cls="detail-label"),
-                            P(
-                                "The image appears to be free of visible defects." if not is_defect else f"{defect_display} defect detected with {detection['confidence']:.0%} confidence. Please review the image for quality control.",
-                                cls="detail-analysis"
-                            ),
-                            cls="detail-row detail-analysis-row"
-                        ),
-                        cls="detection-details-content"
+                    I(**{"data-lucide": "clock"}, style="width: 14px; height: 14px; margin-right: 4px;"),
+                    Span(timestamp.strftime("%d %b at %H:%M"), cls="detection-time"),
+                    cls="detection-timestamp"
+                ),
+                cls="detection-info"
+            ),
+            # Badge and expand button
+            Div(
+                Div(
+                    *(defect_badges(board_counts, "detection-badge badge-defect") if is_defect and board_counts else [Span("Clean", cls="detection-badge badge-clean")]),
+                    cls="badge-group"
+                ),
+                Button(
+                    I(**{"data-lucide": "chevron-down"}, cls="expand-icon"),
+                    cls="expand-button",
+                    onclick=f"toggleDetails({idx}, this)"
+                ),
+                cls="detection-actions"
+            ),
+            cls="detection-card-header"
+        ),
+        # Expandable details
+        Div(
+            Div(
+                # Full-size image is only fetched the first time the card is expanded
+                Img(**{"data-src": f"/image/{idx}"}, alt=detection["filename"], cls="detection-full-image") if has_image else Div(),
+                cls="detection-image-container"
+            ),
+            Div(
+                Div(
+                    Span("Confidence", cls="detail-label"),
+                    Span(f"{detection['confidence']:.0%}", cls="detail-value"),
+                    cls="detail-row"
+                ),
+                Div(
+                    Span("Defect Type", cls="detail-label"),
+                    Span(defect_display if defect_type else "N/A", cls="detail-value"),
+                    cls="detail-row"
+                ) if is_defect else None,
+                Div(
+                    Span("Analysis", cls="detail-label"),
+                    P(
+                        "The image appears to be free of visible defects." if not is_defect else f"{defect_display} defect detected with {detection['confidence']:.0%} confidence. Please review the image for quality control.",
+                        cls="detail-analysis"
                     ),
-                    id=f"details-{idx}",
-                    cls="detection-details hidden"
+                    cls="detail-row detail-analysis-row"
                 ),
-                cls=f"detection-card {'detection-card-defect' if is_defect else ''}"
-            )
-            detection_cards.append(card)
+                cls="detection-details-content"
+            ),
+            id=f"details-{idx}",
+            cls="detection-details hidden"
+        ),
+        # Where scrolling resumes if the live dashboard trims the cards after this one
+        data_cursor=encode_cursor(detection),
+        cls=f"detection-card {'detection-card-defect' if is_defect else ''}"
+    )
+
+def next_page_loader(cursor: str):
+    """Placeholder that swaps itself for the next page of cards when scrolled into view"""
+    return Div(
+        hx_get=f"/dashboard/cards?cursor={quote(cursor)}",
+        hx_trigger="revealed",
+        hx_swap="outerHTML",
+        cls="detections-loader"
+    )
+
+@timed("dashboard_cards")
+def dashboard_cards_handler(cursor: str):
+    """Next page of dashboard cards as an HTML fragment"""
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return Response("Invalid cursor", status_code=400)
+    page, next_cursor = get_detections_page(hours=1, cursor=cursor)
+    cards = [detection_card(d) for d in page]
+    if next_cursor:
+        cards.append(next_page_loader(next_cursor))
+    return tuple(cards)
+
+def live_event(detection):
+    """One detection as an SSE message: its card fragment plus the current window stats"""
+    data = {
+        "card": to_xml(detection_card(detection)),
+        # Totals rather than deltas: records are counted when queued, before they are published, so
+        # adding one per event would count twice anything queued before the page was rendered
+        "stats": rolling_stats.snapshot()
+    }
+    return f"id: {detection['id']}\nevent: detection\ndata: {json.dumps(data)}\n\n"
+
+async def live_catch_up(last_id: int):
+    """Events for detections saved after last_id, or None if there are too many to replay"""
+    missed = await worker_pool.run(get_detections_after, last_id, LIVE_CATCHUP_LIMIT + 1)
+    if len(missed) > LIVE_CATCHUP_LIMIT:
+        return None
+    return [(d["id"], live_event(d)) for d in missed]
+
+def dashboard_events_handler(request, after: str = None):
+    """Stream new detections to an open dashboard, resuming from Last-Event-ID after a reconnect"""
+    last_id = request.headers.get("last-event-id") or after
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    
+    try:
+        events = live_updates.stream(live_event, live_catch_up, last_id)
+    except TooManySubscribersError:
+        return server_busy_response()
+    return EventStream(events)
+
+@timed("dashboard_render")
+def dashboard_page():
+    """Show dashboard of recent detections"""
+    # Statistics and defect type distribution come from the rolling aggregates
+    stats = rolling_stats.snapshot()
+    total_scans = stats["total_scans"]
+    total_defects = stats["total_defects"]
+    total_clean = stats["total_clean"]
+    defect_counts = stats["defect_counts"]
+    
+    # Live updates pick up from the newest record at render time. Read before the page, so a
+    # record committed in between is streamed too rather than lost; the page skips cards it has
+    latest_id = get_latest_detection_id() or 0
+    # Render only the first page of cards; later pages load on scroll
+    first_page, next_cursor = get_detections_page(hours=1)
+    
+    if first_page:
+        detection_cards = [detection_card(d) for d in first_page]
+        if next_cursor:
+            detection_cards.append(next_page_loader(next_cursor))
     else:
         detection_cards = [
             Div(
                 I(**{"data-lucide": "inbox"}, style="width: 48px; height: 48px; color: hsl(var(--muted-foreground)); margin-bottom: 16px;"),
                 P("No detections in the last hour", style="color: hsl(var(--muted-foreground)); font-size: 1.1rem;"),
+                id="detections-empty",
                 style="text-align: center; padding: 60px 20px;"
             )
         ]
@@ -270,6 +402,12 @@ def dashboard_page():
                     P("Last hour activity", cls="dashboard-subtitle"),
                     cls="dashboard-title-container"
                 ),
+                A(
+                    I(**{"data-lucide": "trending-up"}, style="width: 16px; height: 16px; margin-right: 8px;"),
+                    f"{ANALYTICS_DAYS}-day trends",
+                    href="/analytics",
+                    cls="dashboard-button"
+                ),
                 Form(
                     Button(
                         I(**{"data-lucide": "trash-2"}, style="width: 16px; height: 16px; margin-right: 8px;"),
@@ -286,14 +424,14 @@ def dashboard_page():
             # Statistics Cards
             Div(
                 Div(
-                    P(str(total_scans), cls="stat-value-new"),
+                    P(str(total_scans), id="stat-total", cls="stat-value-new"),
                     P("Total Scans", cls="stat-label-new"),
                     cls="stat-card-new"
                 ),
                 Div(
                     Div(
                         I(**{"data-lucide": "alert-triangle"}, style="width: 20px; height: 20px; margin-right: 8px; color: hsl(var(--destructive));"),
-                        P(str(total_defects), style="color: hsl(var(--destructive)); font-size: 2.0rem; font-weight: 700;"),
+                        P(str(total_defects), id="stat-defects", style="color: hsl(var(--destructive)); font-size: 2.0rem; font-weight: 700;"),
                         cls="stat-value-row"
                     ),
                     P("Defects Found", cls="stat-label-new"),
@@ -302,7 +440,7 @@ def dashboard_page():
                 Div(
                     Div(
                         I(**{"data-lucide": "check-circle"}, style="width: 20px; height: 20px; margin-right: 8px; color: hsl(var(--success));"),
-                        P(str(total_clean), style="color: hsl(var(--success)); font-size: 2.0rem; font-weight: 700;"),
+                        P(str(total_clean), id="stat-clean", style="color: hsl(var(--success)); font-size: 2.0rem; font-weight: 700;"),
                         cls="stat-value-row"
                     ),
                     P("Clean", cls="stat-label-new"),
@@ -311,15 +449,17 @@ def dashboard_page():
                 cls="stats-container-new"
             ),
             
-            # Defect Distribution Pie Chart
+            # Defect Distribution Pie Chart, hidden until there is a defect to show
             Div(
                 H3("Defect Type Distribution", cls="chart-title"),
                 Canvas(id="defectChart", style="max-height: 300px;"),
-                cls="chart-container"
-            ) if defect_counts else None,
+                id="chart-container",
+                cls="chart-container",
+                style=None if defect_counts else "display: none;"
+            ),
             
             # Detections List
-            Div(*detection_cards, cls="detections-list"),
+            Div(*detection_cards, id="detections-list", cls="detections-list"),
             
             cls="dashboard-wrapper"
         ),
@@ -327,27 +467,53 @@ def dashboard_page():
         Script(f"""
             lucide.createIcons();
             
+            // Cards added by infinite scroll need their icons rendered too
+            document.body.addEventListener('htmx:afterSwap', () => lucide.createIcons());
+            
+            // Expand/collapse a detection card, loading its full image on first open
+            function toggleDetails(id, button) {{
+                const details = document.getElementById('details-' + id);
+                details.classList.toggle('hidden');
+                const img = details.querySelector('img[data-src]');
+                if (img && !img.getAttribute('src')) {{
+                    img.src = img.dataset.src;
+                }}
+                button.querySelector('.expand-icon').style.transform = details.classList.contains('hidden') ? 'rotate(0deg)' : 'rotate(180deg)';
+            }}
+            
             // Defect distribution pie chart
             const defectData = {json.dumps(defect_counts) if defect_counts else '{}'};
             
-            if (Object.keys(defectData).length > 0) {{
-                const ctx = document.getElementById('defectChart');
-                
-                // Color palette for different defect types
-                const colors = {{
-                    'missing_hole': '#ef4444',
-                    'mouse_bite': '#f97316',
-                    'open_circuit': '#eab308',
-                    'short': '#8b5cf6',
-                    'spur': '#06b6d4',
-                    'spurious_copper': '#ec4899'
-                }};
+            // Color palette for different defect types
+            const colors = {{
+                'missing_hole': '#ef4444',
+                'mouse_bite': '#f97316',
+                'open_circuit': '#eab308',
+                'short': '#8b5cf6',
+                'spur': '#06b6d4',
+                'spurious_copper': '#ec4899'
+            }};
+            let defectChart = null;
+            
+            // Draw the chart, or refresh it in place after a live update
+            function drawChart() {{
+                document.getElementById('chart-container').style.display = Object.keys(defectData).length ? '' : 'none';
+                if (Object.keys(defectData).length === 0) return;
                 
                 const labels = Object.keys(defectData).map(key => key.replace(/_/g, ' ').split(' ').map(w => w.charAt(0).toUpperCase() + w.slice(1)).join(' '));
                 const data = Object.values(defectData);
                 const bgColors = Object.keys(defectData).map(key => colors[key] || '#6b7280');
                 
-                new Chart(ctx, {{
+                if (defectChart) {{
+                    defectChart.data.labels = labels;
+                    defectChart.data.datasets[0].data = data;
+                    defectChart.data.datasets[0].backgroundColor = bgColors;
+                    defectChart.update();
+                    return;
+                }}
+                
+                const ctx = document.getElementById('defectChart');
+                defectChart = new Chart(ctx, {{
                     type: 'pie',
                     data: {{
                         labels: labels,
@@ -389,5 +555,308 @@ def dashboard_page():
                     }}
                 }});
             }}
+            drawChart();
+            
+            // New detections arrive over server-sent events; the browser resumes from Last-Event-ID on reconnect
+            const live = new EventSource('/dashboard/events?after={latest_id}');
+            live.addEventListener('detection', (event) => {{
+                const update = JSON.parse(event.data);
+                showStats(update.stats);
+                // Already on the page if it was committed while the page was rendering
+                if (document.getElementById('details-' + event.lastEventId)) return;
+                document.getElementById('detections-empty')?.remove();
+                const list = document.getElementById('detections-list');
+                list.insertAdjacentHTML('afterbegin', update.card);
+                lucide.createIcons();
+                trimCards(list);
+            }});
+            // Missed more than can be replayed: start over from a fresh page
+            live.addEventListener('reload', () => window.location.reload());
+            
+            // Replace the stat cards and chart with a snapshot of the window
+            function showStats(stats) {{
+                document.getElementById('stat-total').textContent = stats.total_scans;
+                document.getElementById('stat-defects').textContent = stats.total_defects;
+                document.getElementById('stat-clean').textContent = stats.total_clean;
+                for (const key of Object.keys(defectData)) delete defectData[key];
+                Object.assign(defectData, stats.defect_counts);
+                drawChart();
+            }}
+            
+            // Scans leave the window even when no new ones arrive
+            setInterval(() => {{
+                fetch('/stats/dashboard').then(response => response.ok ? response.json() : null).then(stats => stats && showStats(stats));
+            }}, {LIVE_STATS_REFRESH_SECONDS * 1000});
+            
+            // Keep at most {LIVE_MAX_CARDS} cards; the ones dropped load again when scrolled to
+            function trimCards(list) {{
+                const cards = list.querySelectorAll(':scope > .detection-card');
+                if (cards.length <= {LIVE_MAX_CARDS}) return;
+                for (let i = {LIVE_MAX_CARDS}; i < cards.length; i++) cards[i].remove();
+                list.querySelector(':scope > .detections-loader')?.remove();
+                const loader = document.createElement('div');
+                loader.className = 'detections-loader';
+                loader.setAttribute('hx-get', '/dashboard/cards?cursor=' + encodeURIComponent(cards[{LIVE_MAX_CARDS} - 1].dataset.cursor));
+                loader.setAttribute('hx-trigger', 'revealed');
+                loader.setAttribute('hx-swap', 'outerHTML');
+                list.appendChild(loader);
+                htmx.process(loader);
+            }}
+        """)
+    )
+
+@timed("analytics_render")
+def analytics_page(days: int = ANALYTICS_DAYS):
+    """Defect rate by type over the last `days` days, drawn from the daily rollups"""
+    days = max(1, min(days, 366))
+    rates = get_defect_rates(days)
+    series = rates["series"]
+    defect_types = list(rates["by_type"])
+
+    rows = [
+        Tr(
+            Td(Span(format_defect_type(defect_type), cls="defect-type-badge-small")),
+            Td(str(counts["defects"]), style="text-align: right;"),
+            Td(f"{100 * counts['rate']:.2f}%", style="text-align: right;")
+        )
+        for defect_type, counts in rates["by_type"].items()
+    ]
+    chart_data = {
+        "labels": [bucket["bucket"] for bucket in series],
+        "datasets": {
+            defect_type: [100 * bucket["by_type"].get(defect_type, {}).get("rate", 0) for bucket in series]
+            for defect_type in defect_types
+        }
+    }
+
+    return Title("Defect Trends"), Main(
+        Div(
+            Div(
+                Button(
+                    I(**{"data-lucide": "arrow-left"}, style="width: 20px; height: 20px;"),
+                    onclick="window.location.href='/dashboard'",
+                    cls="icon-button back-button"
+                ),
+                Div(
+                    Div(
+                        I(**{"data-lucide": "trending-up"}, style="width: 24px; height: 24px; margin-right: 12px;"),
+                        H1("Defect Trends", cls="dashboard-title-new"),
+                        cls="dashboard-title-row"
+                    ),
+                    P(f"Last {days} days, from the daily rollups", cls="dashboard-subtitle"),
+                    cls="dashboard-title-container"
+                ),
+                cls="dashboard-header-new"
+            ),
+
+            Div(
+                Div(P(str(rates["scans"]), cls="stat-value-new"), P("Total Scans", cls="stat-label-new"), cls="stat-card-new"),
+                Div(
+                    P(str(rates["defects"]), style="color: hsl(var(--destructive)); font-size: 2.0rem; font-weight: 700;"),
+                    P("Defects Found", cls="stat-label-new"),
+                    cls="stat-card-new stat-card-defect"
+                ),
+                Div(
+                    P(f"{100 * rates['defect_rate']:.2f}%", cls="stat-value-new"),
+                    P("Defect Rate", cls="stat-label-new"),
+                    cls="stat-card-new"
+                ),
+                cls="stats-container-new"
+            ),
+
+            Div(
+                H3("Daily Defect Rate by Type (%)", cls="chart-title"),
+                Canvas(id="trendChart", style="max-height: 320px;"),
+                cls="chart-container",
+                style=None if defect_types else "display: none;"
+            ),
+
+            Div(
+                H3("Defect Rate by Type", cls="chart-title"),
+                Table(
+                    Thead(Tr(Th("Type", style="text-align: left;"), Th("Defects", style="text-align: right;"),
+                             Th("Share of scans", style="text-align: right;"))),
+                    Tbody(*rows),
+                    style="width: 100%; border-collapse: collapse;"
+                ) if rows else P("No defects in this period", style="color: hsl(var(--muted-foreground));"),
+                cls="chart-container"
+            ),
+
+            cls="dashboard-wrapper"
+        ),
+        Script(src="https://cdn.jsdelivr.net/npm/chart.js"),
+        Script(f"""
+            lucide.createIcons();
+
+            const trend = {json.dumps(chart_data)};
+            const colors = {{
+                'missing_hole': '#ef4444',
+                'mouse_bite': '#f97316',
+                'open_circuit': '#eab308',
+                'short': '#8b5cf6',
+                'spur': '#06b6d4',
+                'spurious_copper': '#ec4899'
+            }};
+            if (trend.labels.length) {{
+                new Chart(document.getElementById('trendChart'), {{
+                    type: 'line',
+                    data: {{
+                        labels: trend.labels,
+                        datasets: Object.entries(trend.datasets).map(([type, data]) => ({{
+                            label: type.replace(/_/g, ' ').replace(/\b\w/g, c => c.toUpperCase()),
+                            data: data,
+                            borderColor: colors[type] || '#6b7280',
+                            backgroundColor: colors[type] || '#6b7280',
+                            tension: 0.2
+                        }}))
+                    }},
+                    options: {{
+                        responsive: true,
+                        scales: {{ y: {{ beginAtZero: true }} }},
+                        plugins: {{ legend: {{ position: 'bottom' }} }}
+                    }}
+                }});
+            }}
         """)
     )
+
+async def batch_upload_handler(images: list):
+    """Store a set of uploaded images and process them as a background batch job"""
+    filenames = []
+    try:
+        for image in images:
+            filenames.append(await worker_pool.run(store_upload, image.file, image.filename))
+    except UploadTooLargeError:
+        return Response(f"Each image must be at most {MAX_UPLOAD_BYTES // (1024 * 1024)}MB", status_code=413)
+    except QueueFullError:
+        return server_busy_response()
+    
+    # Re-posting the same images after an interruption resumes the same job
+    job = start_batch(BatchJob(upload_job_id(filenames), UPLOAD_DIR, filenames))
+    return JSONResponse({"job_id": job.id, "total": len(filenames), "events": f"/batch/{job.id}/events"})
+
+def batch_events_handler(job_id: str):
+    """Stream a batch job's progress as server-sent events until it finishes"""
+    job = find_job(job_id)
+    if job is None:
+        return Response("Unknown batch job", status_code=404)
+    
+    async def events():
+        last = None
+        while True:
+            progress = job.progress()
+            if progress != last:
+                yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+                last = progress
+            if progress["finished"]:
+                break
+            await asyncio.sleep(0.5)
+    
+    return EventStream(events())
+
+def health_handler():
+    """Liveness: the web process is up and serving"""
+    return JSONResponse({"status": "ok"})
+
+def ready_handler():
+    """Readiness: the model is loaded, so /analyze will not stall on startup"""
+    if model.is_ready():
+        return JSONResponse({"ready": True, "model_load_seconds": model.load_seconds})
+    error = str(model.load_error) if model.load_error else None
+    return JSONResponse({"ready": False, "error": error}, status_code=503)
+
+def batching_stats_handler():
+    """Report batch-size and wait-time metrics for the inference batcher"""
+    return JSONResponse(batcher.metrics.snapshot())
+
+def worker_stats_handler():
+    """Report worker pool queue depth and wait times"""
+    stats = worker_pool.snapshot()
+    stats["inference_queue_depth"] = batcher.queue_depth()
+    return JSONResponse(stats)
+
+def cache_stats_handler():
+    """Report result cache hit rate"""
+    return JSONResponse(result_cache.snapshot())
+
+def dashboard_stats_handler():
+    """The dashboard's stat cards and chart data for the current window"""
+    return JSONResponse(rolling_stats.snapshot())
+
+def writer_stats_handler():
+    """Report the detection write-behind queue depth and flush sizes"""
+    return JSONResponse(detection_writer.snapshot())
+
+def defect_rates_handler(days: int = ANALYTICS_DAYS, period: str = "day"):
+    """Report defect rate by type over the last N days, per day or per hour"""
+    if period not in ROLLUP_PERIODS:
+        return Response(f"period must be one of {', '.join(ROLLUP_PERIODS)}", status_code=400)
+    return JSONResponse(get_defect_rates(max(1, min(days, 366)), period))
+
+def ingest_stats_handler():
+    """Report directory ingestion backlog, lag and how many files were kept, skipped or dropped"""
+    if directory_ingest is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **directory_ingest.snapshot()})
+
+def maintenance_stats_handler():
+    """Report rollup and retention progress of the maintenance job"""
+    return JSONResponse(maintenance.snapshot())
+
+def pipeline_stats_handler():
+    """Report latency percentiles for each pipeline stage"""
+    return JSONResponse(stage_seconds.snapshot())
+
+def metrics_handler():
+    """Stage latencies, scan counts and live gauges in Prometheus text format"""
+    pool = worker_pool.snapshot()
+    gauges = [
+        ("defect_model_ready", "Whether the model is loaded", int(model.is_ready())),
+        ("defect_model_load_seconds", "Time taken to load and warm up the model", model.load_seconds),
+        ("defect_inference_queue_depth", "Images waiting for the inference batcher", batcher.queue_depth()),
+        ("defect_worker_queue_depth", "Tasks waiting for a worker thread", pool["queue_depth"]),
+        ("defect_live_subscribers", "Open live dashboard streams", live_updates.subscribers),
+        ("defect_write_queue_depth", "Detection records waiting to be written", detection_writer.snapshot()["pending"])
+    ]
+    if directory_ingest is not None:
+        ingest = directory_ingest.snapshot()
+        gauges += [
+            ("defect_ingest_waiting_files", "Files noticed by directory ingestion and not yet processed", ingest["waiting"]),
+            ("defect_ingest_lag_seconds", "How long the oldest waiting ingest file has waited", ingest["lag_seconds"])
+        ]
+    return Response(render_metrics(gauges), media_type="text/plain; version=0.0.4")
+
+def _cached_file_response(request, path, media_type: str, max_age: int):
+    """Send a file with ETag/Cache-Control, answering 304 when the client copy is current"""
+    stat = path.stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+def thumbnail_handler(request, detection_id: int):
+    """Serve the cached thumbnail for a detection"""
+    detection = get_detection(detection_id)
+    thumb_path = get_thumbnail(detection["filename"]) if detection else None
+    if thumb_path is None:
+        return Response("Not found", status_code=404)
+    return _cached_file_response(request, thumb_path, thumbnail_media_type(), max_age=86400)
+
+def upload_handler(request, filename: str):
+    """Serve a stored upload by name, for the preview page"""
+    path = upload_path(filename)
+    if path is None or not path.is_file():
+        return Response("Not found", status_code=404)
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    # Stored names carry the content hash, so a name always means the same bytes
+    return _cached_file_response(request, path, media_type, max_age=86400)
+
+def image_handler(request, detection_id: int):
+    """Serve the full-size uploaded image for a detection"""
+    detection = get_detection(detection_id)
+    img_path = UPLOAD_DIR / detection["filename"] if detection else None
+    if img_path is None or not img_path.exists():
+        return Response("Not found", status_code=404)
+    media_type = mimetypes.guess_type(img_path.name)[0] or "application/octet-stream"
+    return _cached_file_response(request, img_path, media_type, max_age=3600)
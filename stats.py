@@ -0,0 +1,90 @@
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable
+
+from config import STATS_WINDOW_MINUTES
+
+class RollingStats:
+    """Per-minute detection counts over a sliding window, updated as records are saved"""
+
+    def __init__(self, window_minutes: int = STATS_WINDOW_MINUTES):
+        self.window_minutes = window_minutes
+        # Oldest bucket on the left: (minute, {"total", "defects", "by_type"})
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _minute(timestamp: datetime) -> int:
+        return int(timestamp.timestamp() // 60)
+
+    def _expire(self, now_minute: int):
+        """Drop buckets that have fallen out of the window"""
+        cutoff = now_minute - self.window_minutes
+        while self._buckets and self._buckets[0][0] <= cutoff:
+            self._buckets.popleft()
+
+    def _bucket_for(self, minute: int) -> Dict:
+        """Find or create the bucket for a minute; records almost always land in the newest one"""
+        for bucket_minute, bucket in reversed(self._buckets):
+            if bucket_minute == minute:
+                return bucket
+            if bucket_minute < minute:
+                break
+
+        bucket = {"total": 0, "defects": 0, "by_type": {}}
+        index = len(self._buckets)
+        while index > 0 and self._buckets[index - 1][0] > minute:
+            index -= 1
+        self._buckets.insert(index, (minute, bucket))
+        return bucket
+
+    def add(self, record: Dict):
+        """Count one detection record"""
+        minute = self._minute(datetime.fromisoformat(record["timestamp"]))
+        with self._lock:
+            now_minute = self._minute(datetime.now())
+            if minute <= now_minute - self.window_minutes:
+                return
+
+            bucket = self._bucket_for(minute)
+            bucket["total"] += 1
+            if record["has_defect"]:
+                bucket["defects"] += 1
+                defect_type = record.get("defect_type")
+                if defect_type:
+                    bucket["by_type"][defect_type] = bucket["by_type"].get(defect_type, 0) + 1
+            self._expire(now_minute)
+
+    def rebuild(self, records: Iterable[Dict]):
+        """Replace all buckets with counts from the given records"""
+        self.clear()
+        for record in records:
+            self.add(record)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def snapshot(self) -> Dict:
+        """Totals for the current window, accurate to one bucket at the trailing edge"""
+        with self._lock:
+            self._expire(self._minute(datetime.now()))
+            total_scans = 0
+            total_defects = 0
+            defect_counts = {}
+            for _, bucket in self._buckets:
+                total_scans += bucket["total"]
+                total_defects += bucket["defects"]
+                for defect_type, count in bucket["by_type"].items():
+                    defect_counts[defect_type] = defect_counts.get(defect_type, 0) + count
+
+        return {
+            "total_scans": total_scans,
+            "total_defects": total_defects,
+            "total_clean": total_scans - total_defects,
+            "defect_counts": defect_counts
+        }
+
+# Shared aggregator for the dashboard
+rolling_stats = RollingStats()
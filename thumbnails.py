@@ -0,0 +1,108 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from config import UPLOAD_DIR, THUMB_DIR, THUMB_SIZE, THUMB_FORMAT, THUMB_QUALITY, THUMB_CACHE_MAX_FILES
+from preprocess import PreparedImage
+
+THUMB_MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+_evict_lock = threading.Lock()
+# Thumbnails in the cache, counted once on first use and then kept up to date, so
+# eviction only lists the directory when the limit is actually crossed
+_cached_count = None
+
+def thumbnail_media_type() -> str:
+    return THUMB_MEDIA_TYPES.get(THUMB_FORMAT, "image/jpeg")
+
+def _thumbnail_path(filename: str) -> Path:
+    """Cache path for an upload's thumbnail, keyed on the name and the size setting"""
+    key = hashlib.sha1(f"{filename}:{THUMB_SIZE[0]}x{THUMB_SIZE[1]}".encode()).hexdigest()
+    return THUMB_DIR / f"{key}.{THUMB_FORMAT.lower()}"
+
+def create_thumbnail(filename: str, prepared: PreparedImage = None) -> Optional[Path]:
+    """Render the thumbnail for an uploaded image into the cache, from already decoded pixels if given"""
+    thumb_path = _thumbnail_path(filename)
+    if prepared is not None:
+        thumb = prepared.thumbnail(THUMB_SIZE)
+    else:
+        source = UPLOAD_DIR / filename
+        if not source.exists():
+            return None
+        with Image.open(source) as img:
+            thumb = ImageOps.exif_transpose(img)
+            thumb.thumbnail(THUMB_SIZE)
+            if thumb.mode not in ("RGB", "L"):
+                thumb = thumb.convert("RGB")
+
+    # Write to a temp file of our own first, so readers never see a partial thumbnail and
+    # concurrent renders of the same upload don't collide; whichever is replaced last wins
+    fd, tmp_name = tempfile.mkstemp(dir=THUMB_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            thumb.save(out, THUMB_FORMAT, quality=THUMB_QUALITY)
+        added = not thumb_path.exists()
+        os.replace(tmp_name, thumb_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    if added:
+        _count_added()
+    return thumb_path
+
+def _count_added():
+    """Count a new thumbnail, evicting once the cache goes over its limit"""
+    global _cached_count
+    with _evict_lock:
+        if _cached_count is None:
+            _cached_count = sum(1 for _ in THUMB_DIR.glob(f"*.{THUMB_FORMAT.lower()}"))
+        else:
+            _cached_count += 1
+        over = _cached_count > THUMB_CACHE_MAX_FILES
+    if over:
+        evict_thumbnails()
+
+def get_thumbnail(filename: str) -> Optional[Path]:
+    """Return the cached thumbnail for an upload, generating it on a cache miss"""
+    thumb_path = _thumbnail_path(filename)
+    if thumb_path.exists():
+        # Bump the access time used for LRU eviction; mtime stays put so ETags are stable
+        os.utime(thumb_path, (time.time(), thumb_path.stat().st_mtime))
+        return thumb_path
+    return create_thumbnail(filename)
+
+def remove_thumbnail(filename: str):
+    """Drop an upload's cached thumbnail, e.g. once the upload itself is deleted"""
+    global _cached_count
+    try:
+        _thumbnail_path(filename).unlink()
+    except FileNotFoundError:
+        return
+    with _evict_lock:
+        if _cached_count:
+            _cached_count -= 1
+
+def evict_thumbnails(max_files: int = THUMB_CACHE_MAX_FILES):
+    """
+    Delete the least recently used thumbnails once the cache is over its limit.
+
+    Trims to 90% of max_files, so the next eviction is a good many new
+    thumbnails away rather than due on the very next one.
+    """
+    global _cached_count
+    with _evict_lock:
+        entries = list(THUMB_DIR.glob(f"*.{THUMB_FORMAT.lower()}"))
+        if len(entries) > max_files:
+            entries.sort(key=lambda p: p.stat().st_atime)
+            excess = len(entries) - (max_files - max_files // 10)
+            for path in entries[:excess]:
+                path.unlink(missing_ok=True)
+            entries = entries[excess:]
+        _cached_count = len(entries)
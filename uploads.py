@@ -0,0 +1,122 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import Response
+
+from config import UPLOAD_DIR, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+from metrics import timed
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+class UploadSizeLimit:
+    """
+    ASGI middleware refusing request bodies over a per-path limit with 413.
+
+    Starlette reads and spools a whole multipart body before a handler sees
+    it, so the limit has to be enforced here: a declared Content-Length over
+    the limit is refused without reading anything, and a body sent without
+    one is answered and cut off as soon as it passes the limit.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await self._refuse(scope, receive, send, limit)
+            return
+
+        received = 0
+        started = False
+        refused = False
+
+        async def limited_receive():
+            nonlocal received, refused
+            if refused:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit and not started:
+                    # Answer now and tell the app the client went away, so it stops reading
+                    refused = True
+                    await self._refuse(scope, receive, send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if refused:
+                # Already answered with 413; whatever the app makes of the cut-off body is dropped
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except ClientDisconnect:
+            # The disconnect this middleware reported after refusing the body
+            if not refused:
+                raise
+
+    @staticmethod
+    async def _refuse(scope, receive, send, limit: int):
+        response = Response(f"Upload is larger than {limit // (1024 * 1024)}MB", status_code=413,
+                            headers={"Connection": "close"})
+        await response(scope, receive, send)
+
+def _safe_name(filename: str) -> str:
+    """Strip directories and unusual characters from a client-supplied filename"""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", Path(filename or "").name).lstrip(".")
+    return name or "upload"
+
+@timed("upload")
+def store_upload(source, filename: str, max_bytes: Optional[int] = MAX_UPLOAD_BYTES) -> str:
+    """
+    Copy an upload stream into UPLOAD_DIR in chunks, hashing as it goes.
+
+    The stored name is prefixed with the content hash, so different images
+    uploaded under the same name no longer overwrite each other. max_bytes
+    of None stores files of any size.
+
+    Returns:
+        str: the stored filename, relative to UPLOAD_DIR
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+
+        stored_name = f"{digest.hexdigest()[:16]}_{_safe_name(filename)}"
+        # Same hash and name means same bytes, so an existing file can stay as is
+        os.replace(tmp_name, UPLOAD_DIR / stored_name)
+        return stored_name
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def upload_path(filename: str) -> Optional[Path]:
+    """Resolve a stored filename inside UPLOAD_DIR, rejecting anything that points elsewhere"""
+    if not filename or filename in (".", "..") or Path(filename).name != filename or "\\" in filename:
+        return None
+    return UPLOAD_DIR / filename